@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Time commands sent to a controller's local API, such as a wall panel would
+send them: alternately ON and OFF over one kept-alive connection
+"""
+import argparse
+import http.client
+import json
+import os
+import statistics
+import time
+from urllib.parse import urlsplit
+
+
+class LocalApiClient:
+    def __init__(self, url, token=os.environ.get("LOCAL_API_TOKEN")):
+        parts = urlsplit(url)
+        self._connection = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=5)
+        self._headers = { "Content-Type": "application/json" }
+        if token:
+            self._headers["Authorization"] = f"Bearer {token}"
+
+    def command(self, thing, state):
+        self._connection.request("PUT", f"/things/{thing}", json.dumps({ "state": state }), self._headers)
+        response = self._connection.getresponse()
+        body = json.loads(response.read())
+        if response.status >= 300:
+            raise RuntimeError(f"HTTP {response.status}: {body}")
+        return body
+
+    def close(self):
+        self._connection.close()
+
+
+def summarise(label, samples):
+    cuts = statistics.quantiles(samples, n=100, method="inclusive")
+    print(f"{label:<24} n={len(samples):<5} p50={cuts[49] * 1000:7.2f}ms "
+          f"p95={cuts[94] * 1000:7.2f}ms p99={cuts[98] * 1000:7.2f}ms max={max(samples) * 1000:7.2f}ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("url", help="e.g. http://garden-pi.local:8091")
+    parser.add_argument("thing")
+    parser.add_argument("--commands", type=int, default=50)
+    parser.add_argument("--interval", type=float, default=0.1, help="seconds between commands")
+    args = parser.parse_args()
+
+    client = LocalApiClient(args.url)
+    samples = []
+    for i in range(args.commands):
+        start = time.perf_counter()
+        client.command(args.thing, "ON" if i % 2 == 0 else "OFF")
+        samples.append(time.perf_counter() - start)
+        time.sleep(args.interval)
+    client.close()
+    summarise("command round trip", samples)
@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+"""
+Compare the per-call cost of a plain function with the same function
+decorated with log_with, with tracing off and on
+"""
+import logging
+import timeit
+
+import logger
+
+
+def add(a, b):
+    return a + b
+
+
+def decorated(level, **kwargs):
+    log = logging.getLogger(f"bench_log_with.{logging.getLevelName(level)}.{kwargs}")
+    log.setLevel(level)
+    log.addHandler(logging.NullHandler())
+    log.propagate = False
+    return logger.log_with(log, device="bench", **kwargs)(add)
+
+
+if __name__ == "__main__":
+    calls = 200000
+    cases = [
+        ("undecorated", add),
+        ("tracing off (INFO)", decorated(logging.INFO)),
+        ("tracing on, rate limited", decorated(logging.DEBUG)),
+        ("tracing on, every call", decorated(logging.DEBUG, max_per_second=None)),
+    ]
+    for label, func in cases:
+        seconds = timeit.timeit(lambda: func(1, 2), number=calls) / calls
+        print(f"{label:<26} {seconds * 1e9:8.0f}ns/call")
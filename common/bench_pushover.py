@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Measure the Pushover client against a local stub of the API: the original
+requests.post per message, the pooled session, the caller's cost of a queued
+send, and how a burst of events collapses into digests
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+import pushover
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        time.sleep(self.server.delay)
+        with self.server.lock:
+            self.server.requests += 1
+            self.server.connections.add(self.client_address)
+        body = json.dumps({ "status": 1, "request": "stub" }).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def stub_server(delay):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StubHandler)
+    server.daemon_threads = True
+    server.delay = delay
+    server.lock = threading.Lock()
+    server.requests = 0
+    server.connections = set()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}/1/messages.json"
+
+
+def reset(server):
+    with server.lock:
+        server.requests = 0
+        server.connections = set()
+
+
+def report(label, server, seconds, messages):
+    print(f"{label:<24} {seconds / messages * 1000:8.2f}ms/message "
+          f"{server.requests:4d} requests {len(server.connections):4d} connections")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--delay", type=float, default=0.002, help="stub API response time in seconds")
+    args = parser.parse_args()
+
+    server, url = stub_server(args.delay)
+
+    start = time.perf_counter()
+    for i in range(args.messages):
+        requests.post(url, timeout=10, data={ "title": "bench", "message": str(i) })
+    report("requests.post", server, time.perf_counter() - start, args.messages)
+
+    reset(server)
+    client = pushover.PushoverClient(api_url=url, min_interval=0, max_pending=args.messages)
+    start = time.perf_counter()
+    for i in range(args.messages):
+        client.send_now("bench", str(i))
+    report("pooled session", server, time.perf_counter() - start, args.messages)
+
+    reset(server)
+    start = time.perf_counter()
+    for i in range(args.messages):
+        client.send("bench", str(i))
+    queued = time.perf_counter() - start
+    client.flush()
+    report("queued send, caller", server, queued, args.messages)
+    report("queued send, drained", server, time.perf_counter() - start, args.messages)
+    client.stop()
+
+    reset(server)
+    client = pushover.PushoverClient(api_url=url, digest_window=0.5, min_interval=0)
+    for i in range(args.messages):
+        client.notify("bench", f"Zone {i % 4}", "on" if i % 2 == 0 else "off")
+    client.flush()
+    print(f"digest: {args.messages} events across 4 zones sent as {server.requests} messages, stats {client.stats()}")
+    client.stop()
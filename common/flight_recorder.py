@@ -0,0 +1,176 @@
+"""
+In-process flight recorder for device commands. Each command's path through
+a daemon is recorded as timestamped stages in a fixed-size ring buffer:
+
+    received   the shadow delta (or the switch) asked for a new state
+    queued     the command was handed to the control thread
+    switched   the pins were switched, or the button push finished
+    hook       the update hook ran
+    reported   the reported state was published to the shadow
+
+Latency from 'received' to each later stage is kept in histograms, and
+serve() exposes them with the recent commands as JSON over HTTP on localhost,
+along with the daemon's memory use.
+"""
+import json
+import logger
+import os
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+_LOG = logger.create("flight_recorder", logger.INFO)
+
+STAGES = ['received', 'queued', 'switched', 'hook', 'reported']
+
+# Upper bounds of the histogram buckets, in milliseconds
+_BUCKETS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000]
+
+
+class Histogram:
+    def __init__(self):
+        self._counts = [0] * (len(_BUCKETS) + 1)
+        self._count = 0
+        self._max = 0.0
+
+    def add(self, ms):
+        index = next((i for i, bound in enumerate(_BUCKETS) if ms <= bound), len(_BUCKETS))
+        self._counts[index] += 1
+        self._count += 1
+        self._max = max(self._max, ms)
+
+    def percentile(self, p):
+        """
+        Upper bound of the bucket holding the p'th percentile, or the maximum
+        if that is lower
+        """
+        if self._count == 0:
+            return None
+        target = p / 100.0 * self._count
+        seen = 0
+        for i, count in enumerate(self._counts):
+            seen += count
+            if seen >= target:
+                return min(_BUCKETS[i], self._max) if i < len(_BUCKETS) else self._max
+        return self._max
+
+    def get(self):
+        return {
+            'count': self._count,
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99),
+            'max': self._max,
+            'buckets': {
+                (f'<={bound}ms' if i < len(_BUCKETS) else 'more'): count
+                for i, (bound, count) in enumerate(zip(_BUCKETS + [None], self._counts)) if count
+            }
+        }
+
+
+class FlightRecorder:
+    """
+    Stages are marked against the thing's open command, so the code marking
+    them only needs to know the thing name. A new command for a thing closes
+    the previous one.
+    """
+    def __init__(self, size=256):
+        self._lock = threading.Lock()
+        self._commands = deque(maxlen=size)
+        self._open = {}
+        self._histograms = { stage: Histogram() for stage in STAGES[1:] }
+
+    def begin(self, thing, command):
+        with self._lock:
+            record = {
+                'thing': thing,
+                'command': str(command),
+                'started': time.time(),
+                'stages': [('received', 0.0)],
+                '_start': time.monotonic()
+            }
+            self._open[thing] = record
+            self._commands.append(record)
+
+    def mark(self, thing, stage):
+        with self._lock:
+            record = self._open.get(thing)
+            if record is None or any(s == stage for s, _ in record['stages']):
+                return
+            ms = (time.monotonic() - record['_start']) * 1000
+            record['stages'].append((stage, ms))
+            self._histograms[stage].add(ms)
+            if stage == STAGES[-1]:
+                del self._open[thing]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'latency_ms': { stage: histogram.get() for stage, histogram in self._histograms.items() },
+                'open': len(self._open)
+            }
+
+    def recent(self, count=50):
+        with self._lock:
+            return [
+                { key: value for key, value in record.items() if not key.startswith('_') }
+                for record in list(self._commands)[-count:]
+            ]
+
+
+RECORDER = FlightRecorder()
+
+
+def process_stats():
+    """
+    Resident memory and thread count of this process, from /proc
+    """
+    stats = { 'threads': threading.active_count() }
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:') or line.startswith('VmHWM:'):
+                    name, value = line.split(':', 1)
+                    stats['rss_kb' if name == 'VmRSS' else 'peak_rss_kb'] = int(value.split()[0])
+    except OSError:
+        pass
+    return stats
+
+
+class _StatsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == '/stats':
+            body = RECORDER.stats()
+            body['process'] = process_stats()
+            body.update(self.server.extra_stats())
+        elif self.path == '/commands':
+            body = RECORDER.recent()
+        else:
+            self.send_error(404)
+            return
+
+        data = json.dumps(body, indent=2).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        _LOG.debug(format, *args)
+
+
+def serve(port, extra_stats=dict, host='127.0.0.1'):
+    """
+    Serve /stats and /commands as JSON on a background thread. extra_stats is
+    called for more figures to merge into /stats, such as queue depths.
+    """
+    port = int(os.environ.get('STATS_PORT', port))
+    server = ThreadingHTTPServer((host, port), _StatsHandler)
+    server.daemon_threads = True
+    server.extra_stats = extra_stats
+    threading.Thread(target=server.serve_forever, name="stats-server", daemon=True).start()
+    _LOG.info(f"serving stats on http://{host}:{port}/stats")
+    return server
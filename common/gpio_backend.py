@@ -0,0 +1,279 @@
+"""
+GPIO access shared by the controllers. A backend is chosen with the
+GPIO_BACKEND environment variable:
+
+    rpi      RPi.GPIO, one pin at a time (the default)
+    chardev  the Linux GPIO character device via libgpiod 2.x, which sets all
+             the pins of a group in a single call
+    sim      a simulation which records a timestamped trace of pin writes
+
+If GPIO_BACKEND isn't set and RPi.GPIO isn't installed, as on a desktop
+machine, the simulation is used. On a Pi where RPi.GPIO is installed but
+can't reach the hardware, such as without access to /dev/gpiomem, the error
+is raised rather than quietly simulating the relays.
+"""
+import abc
+import logger
+import os
+import threading
+import time
+
+HIGH = 1
+LOW = 0
+
+_LOG = logger.create("gpio_backend", logger.INFO)
+
+
+class GpioBackend(abc.ABC):
+    """
+    The operations the controllers need, in BCM pin numbering
+    """
+    def setup_output(self, pin, value=LOW):
+        self.setup_outputs([pin], value)
+
+    @abc.abstractmethod
+    def setup_outputs(self, pins, value=LOW):
+        """
+        With value None each pin keeps the level it already has, such as one
+        left driven by a previous run
+        """
+
+    @abc.abstractmethod
+    def setup_input(self, pin, pull_up=False):
+        pass
+
+    @abc.abstractmethod
+    def write(self, pin, value):
+        pass
+
+    def write_many(self, pins, value):
+        for pin in pins:
+            self.write(pin, value)
+
+    @abc.abstractmethod
+    def read(self, pin):
+        pass
+
+    @abc.abstractmethod
+    def add_edge_callback(self, pin, callback):
+        """
+        Call callback(pin) from a background thread whenever the input changes
+        """
+
+    @abc.abstractmethod
+    def remove_edge_callback(self, pin):
+        pass
+
+    def cleanup(self, pins=None):
+        """
+        Release the pins given, or every pin, leaving any others as they are
+        for the other controllers sharing the Pi
+        """
+
+
+class RPiGpioBackend(GpioBackend):
+    def __init__(self):
+        import RPi.GPIO as gpio
+        self._gpio = gpio
+        gpio.setwarnings(False)
+        gpio.setmode(gpio.BCM)
+
+    def setup_outputs(self, pins, value=LOW):
+        for pin in pins:
+            self._gpio.setup(pin, self._gpio.OUT)
+            if value is not None:
+                self._gpio.output(pin, value)
+
+    def setup_input(self, pin, pull_up=False):
+        pull = self._gpio.PUD_UP if pull_up else self._gpio.PUD_DOWN
+        self._gpio.setup(pin, self._gpio.IN, pull_up_down=pull)
+
+    def write(self, pin, value):
+        self._gpio.output(pin, value)
+
+    def write_many(self, pins, value):
+        # RPi.GPIO accepts a list of channels, though it still writes them in turn
+        self._gpio.output(list(pins), value)
+
+    def read(self, pin):
+        return self._gpio.input(pin)
+
+    def add_edge_callback(self, pin, callback):
+        self._gpio.add_event_detect(pin, self._gpio.BOTH, callback=callback)
+
+    def remove_edge_callback(self, pin):
+        self._gpio.remove_event_detect(pin)
+
+    def cleanup(self, pins=None):
+        if pins is None:
+            self._gpio.cleanup()
+        else:
+            self._gpio.cleanup(list(pins))
+
+
+class CharDevBackend(GpioBackend):
+    """
+    Each setup_outputs() call requests its pins as one group of lines, and
+    write_many() sets every pin of a group in a single ioctl
+    """
+    def __init__(self, chip=os.environ.get("GPIO_CHIP", "/dev/gpiochip0"), consumer="window-controller"):
+        import gpiod
+        from gpiod.line import Bias, Direction, Edge, Value
+        self._gpiod = gpiod
+        self._Bias, self._Direction, self._Edge, self._Value = Bias, Direction, Edge, Value
+        self._chip = chip
+        self._consumer = consumer
+        self._requests = {}
+        self._watchers = {}
+
+    def _value(self, value):
+        return self._Value.ACTIVE if value else self._Value.INACTIVE
+
+    def _request(self, pins, settings):
+        request = self._gpiod.request_lines(self._chip, consumer=self._consumer, config={tuple(pins): settings})
+        for pin in pins:
+            self._requests[pin] = request
+        return request
+
+    def setup_outputs(self, pins, value=LOW):
+        if value is None:
+            # Take the lines as they are to find their levels, then keep them there as outputs
+            request = self._request(pins, self._gpiod.LineSettings(direction=self._Direction.AS_IS))
+            request.reconfigure_lines({
+                pin: self._gpiod.LineSettings(direction=self._Direction.OUTPUT, output_value=level)
+                for pin, level in zip(pins, request.get_values(pins))
+            })
+            return
+        self._request(pins, self._gpiod.LineSettings(
+            direction=self._Direction.OUTPUT, output_value=self._value(value)))
+
+    def setup_input(self, pin, pull_up=False):
+        self._request([pin], self._gpiod.LineSettings(
+            direction=self._Direction.INPUT,
+            bias=self._Bias.PULL_UP if pull_up else self._Bias.PULL_DOWN,
+            edge_detection=self._Edge.BOTH))
+
+    def write(self, pin, value):
+        self._requests[pin].set_value(pin, self._value(value))
+
+    def write_many(self, pins, value):
+        groups = {}
+        for pin in pins:
+            groups.setdefault(id(self._requests[pin]), (self._requests[pin], {}))[1][pin] = self._value(value)
+        for request, values in groups.values():
+            request.set_values(values)
+
+    def read(self, pin):
+        return HIGH if self._requests[pin].get_value(pin) == self._Value.ACTIVE else LOW
+
+    def add_edge_callback(self, pin, callback):
+        stop = threading.Event()
+
+        def watch():
+            request = self._requests[pin]
+            while not stop.is_set():
+                if request.wait_edge_events(0.5):
+                    for event in request.read_edge_events():
+                        callback(event.line_offset)
+
+        thread = threading.Thread(target=watch, name=f"gpio-edge-{pin}", daemon=True)
+        self._watchers[pin] = (stop, thread)
+        thread.start()
+
+    def remove_edge_callback(self, pin):
+        stop, thread = self._watchers.pop(pin)
+        stop.set()
+        thread.join()
+
+    def cleanup(self, pins=None):
+        # Lines are released in the groups they were requested in, so the
+        # other pins of a group go with it
+        pins = list(self._requests) if pins is None else [pin for pin in pins if pin in self._requests]
+        requests = {id(self._requests[pin]): self._requests[pin] for pin in pins}
+        for pin, request in list(self._requests.items()):
+            if id(request) in requests:
+                if pin in self._watchers:
+                    self.remove_edge_callback(pin)
+                del self._requests[pin]
+        for request in requests.values():
+            request.release()
+
+
+class SimulatedBackend(GpioBackend):
+    """
+    Pins are plain values in memory, and every write is appended to trace as
+    (time, pin, value). The clock can be replaced to make the trace fully
+    deterministic. Inputs are driven with set_input(), which calls any edge
+    callback on the calling thread.
+    """
+    def __init__(self, clock=time.monotonic):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._levels = {}
+        self._callbacks = {}
+        self.trace = []
+
+    def setup_outputs(self, pins, value=LOW):
+        if value is None:
+            with self._lock:
+                for pin in pins:
+                    self._levels.setdefault(pin, LOW)
+            return
+        self.write_many(pins, value)
+
+    def setup_input(self, pin, pull_up=False):
+        with self._lock:
+            self._levels[pin] = HIGH if pull_up else LOW
+
+    def write(self, pin, value):
+        self.write_many([pin], value)
+
+    def write_many(self, pins, value):
+        with self._lock:
+            now = self._clock()
+            for pin in pins:
+                self._levels[pin] = value
+                self.trace.append((now, pin, value))
+        _LOG.debug(f"pins {list(pins)} {'high' if value else 'low'}")
+
+    def read(self, pin):
+        with self._lock:
+            return self._levels.get(pin, LOW)
+
+    def add_edge_callback(self, pin, callback):
+        with self._lock:
+            self._callbacks[pin] = callback
+
+    def remove_edge_callback(self, pin):
+        with self._lock:
+            self._callbacks.pop(pin, None)
+
+    def set_input(self, pin, value):
+        with self._lock:
+            previous = self._levels.get(pin, LOW)
+            self._levels[pin] = value
+            callback = self._callbacks.get(pin)
+        if callback is not None and previous != value:
+            callback(pin)
+
+
+_BACKENDS = {
+    "rpi": RPiGpioBackend,
+    "chardev": CharDevBackend,
+    "sim": SimulatedBackend
+}
+
+
+def create(name=None):
+    """
+    Create the backend named, or in GPIO_BACKEND
+    """
+    name = name or os.environ.get("GPIO_BACKEND")
+    if name is not None:
+        return _BACKENDS[name]()
+
+    try:
+        return RPiGpioBackend()
+    except ImportError:
+        _LOG.warning("RPi.GPIO isn't installed; using simulated GPIO")
+        return SimulatedBackend()
@@ -0,0 +1,292 @@
+"""
+Device shadows in AWS IoT Core. An IoTClient holds one MQTT websocket
+connection, and every shadow a daemon handles is multiplexed over it, so a
+Pi with dozens of things still has a single connection and a single set of
+MQTT threads.
+
+Reported states are spooled on disk until IoT Core accepts them, and any
+still waiting are published again whenever the connection comes back. So are
+desired states set locally with Shadow.command(), such as from the LAN API.
+"""
+from AWSIoTPythonSDK.MQTTLib import AWSIoTMQTTShadowClient
+import flight_recorder
+from concurrent.futures import ThreadPoolExecutor
+import json
+import logger
+import os
+import threading
+import time
+from spool import Spool
+
+
+HOST = "aa40w08kkflrp-ats.iot.eu-west-1.amazonaws.com"
+PORT = 443
+ROOT_CA_PATH = "./root-CA.crt"
+
+_LOG = logger.create("iot_client", logger.INFO)
+logger.create("AWSIoTPythonSDK.core", logger.WARN)
+
+
+def _spool_key(thing_name, section):
+    # Thing names can't contain '/', so this can be split apart again
+    return thing_name if section == "reported" else f"{thing_name}/{section}"
+
+
+def _desired_state(state):
+    state = state.get('state')
+    return state if state in ['ON', 'OFF'] else None
+
+
+class Shadow:
+    """
+    One thing's shadow. listen() passes each desired state to the handler as
+    True for ON or False for OFF, and report() publishes the device's state.
+
+    Desired states are applied in shadow version order. One at or below the
+    last version applied, as the get answer racing a delta, or a delta
+    delivered again after a reconnect, is skipped and counted.
+    """
+    def __init__(self, shadow, thing_name, spool, publisher):
+        self._shadow = shadow
+        self._spool = spool
+        self._publisher = publisher
+        self._lock = threading.Lock()
+        self._handler = None
+        self._version_lock = threading.Lock()
+        self._version = 0
+        self._skipped = 0
+        self.thing_name = thing_name
+        self.reported = None
+
+    def report(self, state):
+        value = "ON" if state else "OFF"
+        self.reported = value
+        self.publish(value, self._spool_put("reported", value))
+        flight_recorder.RECORDER.mark(self.thing_name, 'reported')
+
+    def command(self, state):
+        """
+        Apply a state which didn't come from the shadow, such as from the LAN
+        API, as a delta would be. The desired state in the shadow is updated
+        to match in the background, so the cloud doesn't send the old one back.
+        Returns False if nothing is listening to this thing.
+        """
+        if self._handler is None:
+            return False
+        value = "ON" if state else "OFF"
+        flight_recorder.RECORDER.begin(self.thing_name, value)
+        self._handler(state)
+        self._publisher.submit(self.publish, value, self._spool_put("desired", value), "desired")
+        return True
+
+    def publish(self, value, sequence, section="reported"):
+        """
+        Publish a reported or desired state, which is acknowledged in the
+        spool once IoT Core accepts it. A spooled state which has since been
+        replaced is skipped, so a replay can't overwrite a newer one.
+        """
+        key = _spool_key(self.thing_name, section)
+
+        def on_update(payload, response_status, token):
+            if response_status != "accepted":
+                return
+            if sequence is not None:
+                self._spool.ack(key, sequence)
+            if section == "desired":
+                # Already applied, so the delta this version raises can be skipped
+                self._newer(json.loads(payload).get('version'), skip=False)
+
+        with self._lock:
+            if sequence is not None and not self._spool.is_latest(key, sequence):
+                return
+            try:
+                self._shadow.shadowUpdate(json.dumps({ "state": { section: { "state": value } } }), on_update, 5)
+            except Exception as e:
+                _LOG.warning(f"{section} state for {self.thing_name} spooled until reconnected: {e}")
+
+    def stats(self):
+        with self._version_lock:
+            return { 'version': self._version, 'skipped': self._skipped }
+
+    def _newer(self, version, skip=True):
+        """
+        Whether version is later than the last one applied, and if so record
+        it as applied. A stale version is counted if skip is set.
+        """
+        with self._version_lock:
+            if version is None:
+                return True
+            if version <= self._version:
+                if skip:
+                    self._skipped += 1
+                    _LOG.info(f"{self.thing_name}: skipping desired state at version {version}, "
+                              f"already applied {self._version}")
+                return False
+            self._version = version
+            return True
+
+    def _spool_put(self, section, value):
+        try:
+            return self._spool.put(_spool_key(self.thing_name, section), { "state": value })
+        except OSError as e:
+            _LOG.error(f"unable to spool {section} state for {self.thing_name}: {e}")
+            return None
+
+    def listen(self, handler, get=False):
+        """
+        Call handler for every delta, and if get is set for the desired state
+        already in the shadow as well. Returns an Event which is set once the
+        get has been answered, or straight away without one.
+        """
+        thing_name = self.thing_name
+        synced = threading.Event()
+        self._handler = handler
+
+        def apply(state, version):
+            if self._newer(version):
+                flight_recorder.RECORDER.begin(thing_name, state)
+                handler(state == "ON")
+
+        @logger.log_with(_LOG, device=thing_name)
+        def on_get(payload, response_status, token):
+            try:
+                if response_status == "accepted":
+                    document = json.loads(payload)
+                    state = _desired_state(document['state'].get('desired', {}))
+                    if state is not None:
+                        apply(state, document.get('version'))
+            finally:
+                synced.set()
+
+        @logger.log_with(_LOG, device=thing_name)
+        def on_delta(payload, response_status, token):
+            document = json.loads(payload)
+            state = _desired_state(document['state'])
+            if state is not None:
+                apply(state, document.get('version'))
+
+        if get:
+            self._shadow.shadowGet(on_get, 5)
+        else:
+            synced.set()
+        self._shadow.shadowRegisterDeltaCallback(on_delta)
+        return synced
+
+
+class IoTClient:
+    def __init__(self, client_id, host=HOST, port=PORT, root_ca_path=ROOT_CA_PATH, spool_path=None):
+        self._lock = threading.Lock()
+        self._shadows = {}
+        self._online = False
+        self._connects = 0
+        self._replayed = 0
+        self._publisher = ThreadPoolExecutor(max_workers=1, thread_name_prefix="shadow-publish")
+        self._spool = Spool(spool_path or os.environ.get("SPOOL_FILE", f"{client_id}-spool.jsonl"))
+
+        self._iot = AWSIoTMQTTShadowClient(client_id, useWebsocket=True)
+        self._iot.configureEndpoint(host, port)
+        self._iot.configureCredentials(root_ca_path)
+        self._iot.configureAutoReconnectBackoffTime(1, 32, 20)
+        self._iot.configureConnectDisconnectTimeout(10)
+        self._iot.configureMQTTOperationTimeout(5)
+
+        # On the shadow client: connect() copies these to the MQTT connection,
+        # replacing any set there
+        self._iot.onOnline = self._on_online
+        self._iot.onOffline = self._on_offline
+
+    def connect(self):
+        self._iot.connect()
+        return self
+
+    def disconnect(self):
+        """
+        Finish publishing, disconnect, and sync and close the spool
+        """
+        self._publisher.shutdown()
+        try:
+            self._iot.disconnect()
+        except Exception as e:
+            _LOG.warning(f"unable to disconnect cleanly: {e}")
+        self._spool.close()
+
+    def shadow(self, thing_name):
+        """
+        The handler for a thing's shadow, created on first use
+        """
+        with self._lock:
+            shadow = self._shadows.get(thing_name)
+            if shadow is None:
+                shadow = Shadow(self._iot.createShadowHandlerWithName(thing_name, True), thing_name,
+                                self._spool, self._publisher)
+                self._shadows[thing_name] = shadow
+            return shadow
+
+    def shadows(self):
+        with self._lock:
+            return dict(self._shadows)
+
+    def listen_all(self, handlers, timeout=10, workers=8):
+        """
+        Listen to the shadows of many things, getting the desired state of
+        each. Every subscription and get waits for a round trip to IoT Core,
+        so they are made in parallel, and this returns once all the things
+        have been answered or the timeout passes. handlers maps thing names to
+        handlers; the names of things without an answer are returned.
+        """
+        deadline = time.monotonic() + timeout
+        pool = ThreadPoolExecutor(max_workers=max(1, min(workers, len(handlers))), thread_name_prefix="shadow-sync")
+        futures = {
+            thing_name: pool.submit(lambda t, h: self.shadow(t).listen(h, get=True), thing_name, handler)
+            for thing_name, handler in handlers.items()
+        }
+        pool.shutdown(wait=False)
+
+        missing = []
+        for thing_name, future in futures.items():
+            try:
+                synced = future.result(max(0.0, deadline - time.monotonic()))
+                if synced.wait(max(0.0, deadline - time.monotonic())):
+                    continue
+            except Exception as e:
+                _LOG.error(f"unable to listen to {thing_name}: {e}")
+            missing.append(thing_name)
+        return missing
+
+    def stats(self):
+        with self._lock:
+            shadows = list(self._shadows.values())
+            stats = {
+                'connections': 1 if self._online else 0,
+                'connects': self._connects,
+                'shadows': len(shadows),
+                'replayed': self._replayed
+            }
+        stats['spool'] = self._spool.stats()
+        stats['things'] = { shadow.thing_name: shadow.stats() for shadow in shadows }
+        stats['skipped'] = sum(thing['skipped'] for thing in stats['things'].values())
+        return stats
+
+    def _on_online(self):
+        with self._lock:
+            self._online = True
+            self._connects += 1
+        _LOG.info("connected")
+        # The SDK calls this on its own thread, which mustn't block on publishing
+        threading.Thread(target=self._replay, name="spool-replay", daemon=True).start()
+
+    def _replay(self):
+        pending = self._spool.pending()
+        if not pending:
+            return
+        _LOG.info(f"replaying {len(pending)} spooled states")
+        for key, sequence, message in pending:
+            thing_name, _, section = key.partition("/")
+            self.shadow(thing_name).publish(message["state"], sequence, section or "reported")
+        with self._lock:
+            self._replayed += len(pending)
+
+    def _on_offline(self):
+        with self._lock:
+            self._online = False
+        _LOG.warning("disconnected")
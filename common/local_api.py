@@ -0,0 +1,140 @@
+"""
+Control API on the local network, so automations and a wall panel can drive
+the devices directly rather than round trip through Alexa, Lambda and IoT
+Core:
+
+    GET  /things          every thing and the state it last reported
+    GET  /things/<name>   one thing
+    PUT  /things/<name>   {"state": "ON"} or {"state": "OFF"}
+
+A command is applied by the same handler as a shadow delta and answered as
+soon as it has been handed to the controller. The device reports its new
+state to the shadow as usual, and the thing's desired state is brought into
+line in the background. Connections are kept alive, so a panel making
+repeated requests pays for the TCP handshake once.
+
+Set LOCAL_API_TOKEN to require an "Authorization: Bearer <token>" header;
+an empty one counts as unset.
+The API only listens on the loopback interface unless LOCAL_API_HOST says
+otherwise, and refuses to listen anywhere else without a token, since anyone
+who can reach it can open the windows.
+"""
+import hmac
+import ipaddress
+import json
+import logger
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+_LOG = logger.create("local_api", logger.INFO)
+
+_TOKEN = os.environ.get("LOCAL_API_TOKEN") or None
+_HOST = os.environ.get("LOCAL_API_HOST", "127.0.0.1")
+
+# A command is a few bytes of JSON; anything bigger isn't read
+MAX_BODY = 1024
+
+
+class _ApiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        if not self._authorised():
+            return
+        things = self.server.things()
+        if self.path == '/things':
+            self._reply(200, [_describe(thing) for thing in things.values()])
+            return
+        thing = self._thing(things)
+        if thing is not None:
+            self._reply(200, _describe(thing))
+
+    def do_PUT(self):
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            if length < 0:
+                raise ValueError(length)
+        except ValueError:
+            # The body can't be found, so neither can the next request
+            self.close_connection = True
+            self._reply(400, { 'error': 'invalid Content-Length' })
+            return
+        if length > MAX_BODY:
+            self.close_connection = True
+            self._reply(413, { 'error': f'body over {MAX_BODY} bytes' })
+            return
+        body = self.rfile.read(length)
+        if not self._authorised():
+            return
+        thing = self._thing(self.server.things())
+        if thing is None:
+            return
+        try:
+            state = json.loads(body)['state']
+            if state not in ['ON', 'OFF']:
+                raise ValueError(state)
+        except (KeyError, TypeError, ValueError):
+            self._reply(400, { 'error': 'expected {"state": "ON"} or {"state": "OFF"}' })
+            return
+
+        if not thing.command(state == 'ON'):
+            self._reply(409, { 'error': f'{thing.thing_name} is not ready for commands' })
+            return
+        self._reply(202, { 'thing': thing.thing_name, 'state': state })
+
+    def _authorised(self):
+        if _TOKEN is None or hmac.compare_digest(self.headers.get('Authorization', ''), f'Bearer {_TOKEN}'):
+            return True
+        self._reply(401, { 'error': 'unauthorised' })
+        return False
+
+    def _thing(self, things):
+        prefix, _, name = self.path.partition('/things/')
+        thing = things.get(name) if prefix == '' else None
+        if thing is None:
+            self._reply(404, { 'error': f'no such thing {self.path}' })
+        return thing
+
+    def _reply(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        _LOG.debug(format, *args)
+
+
+def _describe(thing):
+    return { 'thing': thing.thing_name, 'reported': thing.reported }
+
+
+def _is_loopback(host):
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return host == 'localhost'
+
+
+def serve(port, things, host=None):
+    """
+    Serve the API on a background thread. things is called for the things
+    which can be controlled, by name: anything with thing_name, reported and
+    command(state), like the shadows from iot_client. Raises ValueError for a
+    host other than loopback without LOCAL_API_TOKEN set.
+    """
+    port = int(os.environ.get('LOCAL_API_PORT', port))
+    host = host or _HOST
+    if _TOKEN is None and not _is_loopback(host):
+        raise ValueError(f"set LOCAL_API_TOKEN to serve the local control API on {host}")
+    server = ThreadingHTTPServer((host, port), _ApiHandler)
+    server.daemon_threads = True
+    server.things = things
+    threading.Thread(target=server.serve_forever, name="local-api", daemon=True).start()
+    _LOG.info(f"serving local control API on http://{host}:{server.server_port}/things")
+    return server
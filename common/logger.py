@@ -0,0 +1,182 @@
+"""
+Logging shared by the controller daemons. Records from every logger made
+with create() go through one queue to a background thread, so GPIO and MQTT
+callback threads never wait on log output. That thread writes records out in
+batches, to stderr by default or straight to journald with LOG_TARGET=journald.
+"""
+import atexit
+import functools
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+from logging import ERROR, WARN, WARNING, INFO, DEBUG
+
+
+_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Write out at most this many records at once, and no later than this after the first
+BATCH_SIZE = 32
+BATCH_INTERVAL = 1.0
+
+
+class BatchingStreamHandler(logging.StreamHandler):
+    """
+    Collects formatted records and writes each batch to the stream in a single
+    write, rather than writing and flushing every record. A warning or worse
+    is written straight away, with anything batched before it, so it isn't
+    lost if the process dies soon after. Without a stream it writes to
+    whatever sys.stderr is at the time, as it may have been replaced.
+    """
+    def __init__(self, stream=None, batch_size=BATCH_SIZE):
+        super().__init__(stream)
+        self._stderr = stream is None
+        self._batch_size = batch_size
+        self._batch = []
+
+    def emit(self, record):
+        try:
+            self._batch.append(self.format(record) + self.terminator)
+            if len(self._batch) >= self._batch_size or record.levelno >= WARNING:
+                self.flush()
+        except Exception:
+            self.handleError(record)
+
+    def flush(self):
+        self.acquire()
+        try:
+            if self._stderr:
+                self.stream = sys.stderr
+            if self._batch:
+                self.stream.write(''.join(self._batch))
+                self._batch = []
+            super().flush()
+        finally:
+            self.release()
+
+
+class _BatchingQueueListener(logging.handlers.QueueListener):
+    """
+    Flushes the handlers BATCH_INTERVAL after the first record of a batch,
+    even while more keep arriving, so a partial batch is never held back for
+    long
+    """
+    def __init__(self, log_queue, *handlers):
+        super().__init__(log_queue, *handlers)
+        self._flush_at = None
+
+    def dequeue(self, block):
+        while True:
+            if self._flush_at is not None and time.monotonic() >= self._flush_at:
+                self._flush()
+            timeout = None if self._flush_at is None else max(0.0, self._flush_at - time.monotonic())
+            try:
+                record = self.queue.get(block, timeout)
+            except queue.Empty:
+                if not block:
+                    raise
+                continue
+            if self._flush_at is None:
+                self._flush_at = time.monotonic() + BATCH_INTERVAL
+            return record
+
+    def _flush(self):
+        self._flush_at = None
+        for handler in self.handlers:
+            handler.flush()
+
+    def stop(self):
+        super().stop()
+        self._flush()
+
+
+_lock = threading.Lock()
+_queue_handler = None
+_listener = None
+
+
+def _target_handler():
+    if os.environ.get('LOG_TARGET') == 'journald':
+        try:
+            from systemd.journal import JournalHandler
+            handler = JournalHandler(SYSLOG_IDENTIFIER=os.path.basename(sys.argv[0]) or 'python')
+            handler.setFormatter(logging.Formatter('%(name)s - %(levelname)s - %(message)s'))
+            return handler
+        except ImportError:
+            sys.stderr.write('python-systemd is not installed; logging to stderr\n')
+
+    handler = BatchingStreamHandler()
+    handler.setFormatter(logging.Formatter(_FORMAT))
+    return handler
+
+
+def _shared_handler():
+    global _queue_handler, _listener
+    with _lock:
+        if _queue_handler is None:
+            log_queue = queue.SimpleQueue()
+            _queue_handler = logging.handlers.QueueHandler(log_queue)
+            _listener = _BatchingQueueListener(log_queue, _target_handler())
+            _listener.start()
+            atexit.register(_listener.stop)
+        return _queue_handler
+
+
+def create(name, level):
+    """
+    Get a logger which writes through the shared queue. Calling this again
+    for the same name only updates the level.
+    """
+    logger = logging.getLogger(name)
+    logger.setLevel(level)
+    handler = _shared_handler()
+    if handler not in logger.handlers:
+        logger.addHandler(handler)
+    return logger
+
+
+class log_with:
+    """
+    Traces entry to and exit from a function at DEBUG level, with the call's
+    duration. The level is checked once, when the function is decorated: if
+    DEBUG isn't enabled the function is returned as it is and tracing costs
+    nothing. Otherwise at most max_per_second calls of the function are traced
+    each second, and the number skipped is reported with the next trace.
+    """
+    def __init__(self, logger, max_per_second=10, **extra_args):
+        self._logger = logger
+        self._max_per_second = max_per_second
+        self._extra_args = extra_args
+
+    def __call__(self, func):
+        if not self._logger.isEnabledFor(DEBUG):
+            return func
+
+        logger = self._logger
+        extra_args = self._extra_args
+        max_per_second = self._max_per_second
+        window = [0, 0, 0]  # second, traced in that second, skipped since last trace
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            now = int(time.monotonic())
+            if now != window[0]:
+                window[0] = now
+                window[1] = 0
+            if max_per_second is not None and window[1] >= max_per_second:
+                window[2] += 1
+                return func(*args, **kwargs)
+            window[1] += 1
+            skipped = window[2]
+            window[2] = 0
+
+            logger.debug('ENTER %s %s %s %s%s', func.__name__, extra_args, args, kwargs,
+                         f' ({skipped} calls not traced)' if skipped else '')
+            start = time.perf_counter()
+            result = func(*args, **kwargs)
+            logger.debug('EXIT %s %s in %.3fms', func.__name__, result, (time.perf_counter() - start) * 1000)
+            return result
+        return wrapper
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+Pushover notifications, shared by the controllers. Messages are queued and
+sent by a background thread over one pooled HTTPS session, so callers never
+wait on DNS, TLS or the API, and at most one message goes out every
+MIN_INTERVAL seconds.
+
+notify() collects the events for a subject over DIGEST_WINDOW seconds and
+sends them as a single digest, e.g. "Garden Fairy Lights on, off, on", so a
+burst of switching is one notification rather than one per change.
+
+A message refused with HTTP 429, once the application's monthly limit is
+used up, is queued again rather than lost, and nothing more is sent until
+the limit resets, as given by X-Limit-App-Reset, or for a backoff growing
+from RETRY_DELAY to MAX_RETRY_DELAY if the API doesn't say. Sending also
+waits for the reset once X-Limit-App-Remaining reaches zero.
+
+Set PUSHOVER_API_URL to send to another endpoint, such as a local stub.
+"""
+import atexit
+import itertools
+import logger
+import os
+import requests
+import threading
+import time
+
+
+API_URL = os.environ.get("PUSHOVER_API_URL", "https://api.pushover.net/1/messages.json")
+
+_PUSHOVER_USER_KEY = os.environ.get("PUSHOVER_USER_KEY", "")
+_PUSHOVER_API_TOKEN = os.environ.get("PUSHOVER_API_TOKEN", "")
+
+DIGEST_WINDOW = 5.0
+MIN_INTERVAL = 1.0
+MAX_PENDING = 32
+RETRY_DELAY = 60.0
+MAX_RETRY_DELAY = 3600.0
+
+_LOG = logger.create("pushover", logger.INFO)
+
+
+class PushoverClient:
+    def __init__(self, api_url=API_URL, digest_window=DIGEST_WINDOW, min_interval=MIN_INTERVAL,
+                 max_pending=MAX_PENDING, timeout=10):
+        self._api_url = api_url
+        self._digest_window = digest_window
+        self._min_interval = min_interval
+        self._max_pending = max_pending
+        self._timeout = timeout
+        self._session = requests.Session()
+        self._condition = threading.Condition()
+        self._sequence = itertools.count()
+        self._pending = []
+        self._digests = {}
+        self._sending = False
+        self._running = True
+        self._next_send = 0.0
+        self._retry_delay = RETRY_DELAY
+        self._stats = { 'sent': 0, 'failed': 0, 'dropped': 0, 'coalesced': 0, 'rate_limited': 0,
+                        'max_latency': 0.0, 'remaining': None }
+        self._thread = threading.Thread(target=self._run, name="pushover", daemon=True)
+        self._thread.start()
+
+    def send(self, title, message, url=None):
+        """
+        Queue a message to be sent as soon as the rate limit allows
+        """
+        with self._condition:
+            self._queue({ 'due': time.monotonic(), 'title': title, 'message': message, 'url': url })
+
+    def notify(self, title, subject, event):
+        """
+        Queue an event for a subject, sent as a digest with any others for the
+        same subject within the digest window
+        """
+        with self._condition:
+            entry = self._digests.get((title, subject))
+            if entry is not None:
+                entry['events'].append(event)
+                self._stats['coalesced'] += 1
+                return
+            entry = { 'due': time.monotonic() + self._digest_window, 'title': title, 'subject': subject, 'events': [event] }
+            self._digests[(title, subject)] = entry
+            self._queue(entry)
+
+    def send_now(self, title, message, url=None):
+        """
+        Send a message straight away on the caller's thread, returning the API
+        response, or the HTTP status if it failed
+        """
+        rsp = self._post(title, message, url)
+        return rsp.json() if rsp.status_code < 300 else rsp.status_code
+
+    def _post(self, title, message, url):
+        return self._session.post(self._api_url, timeout=self._timeout, data={
+            'token': _PUSHOVER_API_TOKEN,
+            'user':  _PUSHOVER_USER_KEY,
+            'title': title,
+            'message': message,
+            'sound': 'none',
+            'url': url
+        })
+
+    def flush(self, timeout=None):
+        """
+        Wait until everything queued has been sent, digests included. Returns
+        False if the timeout passed first.
+        """
+        with self._condition:
+            for entry in self._pending:
+                entry['due'] = 0
+            self._condition.notify_all()
+            return self._condition.wait_for(lambda: not self._pending and not self._sending, timeout)
+
+    def stop(self, timeout=5):
+        self.flush(timeout)
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        self._thread.join(timeout)
+        self._session.close()
+
+    def stats(self):
+        with self._condition:
+            return dict(self._stats, pending=len(self._pending))
+
+    def _queue(self, entry):
+        if len(self._pending) >= self._max_pending:
+            dropped = min(self._pending, key=lambda e: (e['due'], e['seq']))
+            self._remove(dropped)
+            self._stats['dropped'] += 1
+            _LOG.warning(f"dropping notification {dropped['title']}: too many queued")
+        entry['seq'] = next(self._sequence)
+        entry['queued'] = time.monotonic()
+        self._pending.append(entry)
+        self._condition.notify_all()
+
+    def _requeue(self, entry):
+        """
+        Put back an entry which couldn't be sent yet, ahead of anything queued
+        since, or into the digest that has since opened for its subject. It
+        was let in already, so it isn't held to max_pending again.
+        """
+        if 'events' in entry:
+            newer = self._digests.get((entry['title'], entry['subject']))
+            if newer is not None:
+                newer['events'][:0] = entry['events']
+                newer.update(due=entry['due'], seq=entry['seq'], queued=entry['queued'])
+                return
+            self._digests[(entry['title'], entry['subject'])] = entry
+        self._pending.append(entry)
+        self._condition.notify_all()
+
+    def _hold_until(self, reset):
+        """
+        Send nothing more until the Unix time reset, if given, or for the
+        current retry delay, which doubles each time until a send succeeds
+        """
+        if reset is not None and reset > time.time():
+            delay = reset - time.time()
+        else:
+            delay = self._retry_delay
+            self._retry_delay = min(self._retry_delay * 2, MAX_RETRY_DELAY)
+        self._next_send = max(self._next_send, time.monotonic() + delay)
+        return delay
+
+    def _remove(self, entry):
+        self._pending.remove(entry)
+        if 'events' in entry:
+            del self._digests[(entry['title'], entry['subject'])]
+
+    def _next_due(self):
+        """
+        The entry to send next, and how long until it may go
+        """
+        if not self._pending:
+            return None, None
+        entry = min(self._pending, key=lambda e: (e['due'], e['seq']))
+        return entry, max(entry['due'], self._next_send) - time.monotonic()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while True:
+                    entry, wait = self._next_due()
+                    if entry is None and not self._running:
+                        return
+                    if entry is not None and wait <= 0:
+                        break
+                    self._condition.wait(wait)
+                self._remove(entry)
+                self._sending = True
+                self._next_send = time.monotonic() + self._min_interval
+
+            message = entry.get('message') or f"{entry['subject']} {', '.join(entry['events'])}"
+            try:
+                rsp = self._post(entry['title'], message, entry.get('url'))
+                status = rsp.status_code
+                remaining = _header(rsp, 'X-Limit-App-Remaining')
+                reset = _header(rsp, 'X-Limit-App-Reset')
+            except Exception as e:
+                _LOG.error(f"unable to send notification {entry['title']}: {e}")
+                status, remaining, reset = None, None, None
+
+            with self._condition:
+                if remaining is not None:
+                    self._stats['remaining'] = int(remaining)
+                if status == 429:
+                    delay = self._hold_until(reset)
+                    self._stats['rate_limited'] += 1
+                    _LOG.warning(f"notification {entry['title']} rate limited: retrying in {delay:.0f}s")
+                    self._requeue(entry)
+                else:
+                    succeeded = status is not None and status < 300
+                    if succeeded:
+                        self._retry_delay = RETRY_DELAY
+                        if remaining == 0 and reset is not None:
+                            delay = self._hold_until(reset)
+                            _LOG.warning(f"no notifications left: holding them for {delay:.0f}s")
+                    elif status is not None:
+                        _LOG.error(f"unable to send notification {entry['title']}: HTTP {status}")
+                    self._stats['sent' if succeeded else 'failed'] += 1
+                    self._stats['max_latency'] = max(self._stats['max_latency'], time.monotonic() - entry['queued'])
+                self._sending = False
+                self._condition.notify_all()
+
+
+def _header(rsp, name):
+    """
+    A numeric rate limit header of the response, or None if it's missing or
+    malformed
+    """
+    try:
+        return float(rsp.headers[name])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def client():
+    """
+    The shared client, created on first use
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = PushoverClient()
+                atexit.register(_client.stop)
+    return _client
+
+
+def send(title, message, url=None):
+    client().send(title, message, url)
+
+
+def notify(title, subject, event):
+    client().notify(title, subject, event)
+
+
+def stats():
+    return client().stats() if _client is not None else {}
+
+
+if __name__ == "__main__":
+    import sys
+    print(client().send_now(*sys.argv[1:]))
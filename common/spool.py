@@ -0,0 +1,157 @@
+"""
+Outbound messages waiting to be acknowledged, kept on disk so that nothing is
+lost while the connection is down or the daemon restarts. Only the latest
+message for each key matters, such as a thing's reported state, so a newer
+one replaces any still waiting.
+
+The spool is an append-only JSON lines file of puts and acks. When it grows
+past max_bytes it is compacted down to the messages still waiting. Appends
+are flushed straight away but only synced every sync_interval seconds, so a
+burst of reports costs one fsync rather than one each, which spares the SD
+card. A power cut can lose at most that interval.
+"""
+import json
+import logger
+import os
+import tempfile
+import threading
+
+
+_LOG = logger.create("spool", logger.INFO)
+
+
+class Spool:
+    def __init__(self, path, max_bytes=64 * 1024, sync_interval=1.0):
+        self._path = path
+        self._max_bytes = max_bytes
+        self._sync_interval = sync_interval
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._sequence = 0
+        self._sync_timer = None
+        self._syncs = 0
+        self._compactions = 0
+
+        self._load()
+        self._file = None
+        self._compact()
+
+    def put(self, key, message):
+        """
+        Add a message to the spool, replacing any waiting for the same key,
+        and return its sequence number for ack()
+        """
+        with self._lock:
+            self._sequence += 1
+            self._pending[key] = (self._sequence, message)
+            self._append({ "key": key, "seq": self._sequence, "message": message })
+            return self._sequence
+
+    def ack(self, key, sequence):
+        """
+        Remove a delivered message, unless a newer one has replaced it
+        """
+        with self._lock:
+            if self._pending.get(key, (None,))[0] == sequence:
+                del self._pending[key]
+                self._append({ "key": key, "ack": sequence })
+
+    def is_latest(self, key, sequence):
+        with self._lock:
+            return self._pending.get(key, (None,))[0] == sequence
+
+    def pending(self):
+        """
+        The messages waiting, as (key, sequence, message) in the order they
+        were put
+        """
+        with self._lock:
+            return sorted(((key, seq, message) for key, (seq, message) in self._pending.items()),
+                          key=lambda item: item[1])
+
+    def stats(self):
+        with self._lock:
+            return {
+                'pending': len(self._pending),
+                'bytes': self._file.tell(),
+                'syncs': self._syncs,
+                'compactions': self._compactions
+            }
+
+    def close(self):
+        with self._lock:
+            if self._sync_timer is not None:
+                self._sync_timer.cancel()
+            self._sync()
+            self._file.close()
+
+    def _load(self):
+        try:
+            with open(self._path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # A line cut short by a power cut; anything after it is still good
+                        continue
+                    self._replay(entry)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            _LOG.warning(f"ignoring unreadable spool {self._path}: {e}")
+        if self._pending:
+            _LOG.info(f"{len(self._pending)} messages waiting in {self._path}")
+
+    def _replay(self, entry):
+        key = entry["key"]
+        if "ack" in entry:
+            if self._pending.get(key, (None,))[0] == entry["ack"]:
+                del self._pending[key]
+        else:
+            self._pending[key] = (entry["seq"], entry["message"])
+        self._sequence = max(self._sequence, entry.get("seq", entry.get("ack", 0)))
+
+    def _append(self, entry):
+        self._file.write(json.dumps(entry) + "\n")
+        self._file.flush()
+        if self._file.tell() > self._max_bytes:
+            self._compact()
+        elif self._sync_timer is None:
+            self._sync_timer = threading.Timer(self._sync_interval, self._timed_sync)
+            self._sync_timer.daemon = True
+            self._sync_timer.start()
+
+    def _timed_sync(self):
+        with self._lock:
+            self._sync_timer = None
+            self._sync()
+
+    def _sync(self):
+        try:
+            os.fsync(self._file.fileno())
+            self._syncs += 1
+        except (OSError, ValueError) as e:
+            _LOG.error(f"unable to sync spool: {e}")
+
+    def _compact(self):
+        """
+        Rewrite the spool with just the messages waiting, replacing the old
+        file atomically
+        """
+        directory = os.path.dirname(os.path.abspath(self._path))
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".spool-")
+        try:
+            with os.fdopen(fd, "w") as f:
+                for key, (seq, message) in sorted(self._pending.items(), key=lambda item: item[1][0]):
+                    f.write(json.dumps({ "key": key, "seq": seq, "message": message }) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self._path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+        if self._file is not None:
+            self._file.close()
+            self._compactions += 1
+        self._file = open(self._path, "a")
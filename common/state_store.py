@@ -0,0 +1,37 @@
+"""
+Small JSON state files which survive restarts. Writes go to a temporary file
+which is synced and then renamed over the old one, so a power cut leaves
+either the old state or the new one, never a partial file.
+"""
+import json
+import logger
+import os
+import tempfile
+
+
+_LOG = logger.create("state_store", logger.INFO)
+
+
+def load(path, default=None):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return default
+    except (OSError, ValueError) as e:
+        _LOG.warning(f"ignoring unreadable state file {path}: {e}")
+        return default
+
+
+def save(path, state):
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".state-")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
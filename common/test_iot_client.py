@@ -0,0 +1,142 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from spool import Spool
+
+try:
+    from AWSIoTPythonSDK.core.protocol.mqtt_core import MqttCore
+    import iot_client
+except ImportError:
+    iot_client = None
+
+
+@unittest.skipIf(iot_client is None, "AWSIoTPythonSDK isn't installed")
+class ConnectionCallbacksTest(unittest.TestCase):
+    """
+    Drives the real SDK's connect, stopping short of the network, and raises
+    its connection events as the MQTT core would
+    """
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        root_ca_path = os.path.join(directory.name, "root-CA.crt")
+        open(root_ca_path, "w").close()
+
+        for method in ["connect", "disconnect"]:
+            patcher = mock.patch.object(MqttCore, method, return_value=True)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.client = iot_client.IoTClient("test", root_ca_path=root_ca_path,
+                                           spool_path=os.path.join(directory.name, "spool.jsonl"))
+
+    def mqtt_core(self):
+        return self.client._iot.getMQTTConnection()._mqtt_core
+
+    def test_online_and_offline_reach_the_client(self):
+        self.client.connect()
+        self.assertEqual(self.client.stats()['connections'], 0)
+
+        self.mqtt_core().on_online()
+        stats = self.client.stats()
+        self.assertEqual((stats['connections'], stats['connects']), (1, 1))
+
+        self.mqtt_core().on_offline()
+        self.mqtt_core().on_online()
+        stats = self.client.stats()
+        self.assertEqual((stats['connections'], stats['connects']), (1, 2))
+
+        self.client.disconnect()
+
+    def test_disconnect_closes_the_spool(self):
+        self.client.connect()
+        self.client.disconnect()
+        self.assertTrue(self.client._spool._file.closed)
+
+
+@unittest.skipIf(iot_client is None, "AWSIoTPythonSDK isn't installed")
+class ShadowPublishTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.spool = Spool(os.path.join(directory.name, "spool.jsonl"))
+        self.addCleanup(self.spool.close)
+        self.sdk_shadow = mock.Mock()
+        self.shadow = iot_client.Shadow(self.sdk_shadow, "garden-lights", self.spool, None)
+
+    def test_stale_sequence_is_not_republished(self):
+        stale = self.spool.put("garden-lights", { "state": "ON" })
+        latest = self.spool.put("garden-lights", { "state": "OFF" })
+
+        self.shadow.publish("ON", stale)
+        self.sdk_shadow.shadowUpdate.assert_not_called()
+
+        self.shadow.publish("OFF", latest)
+        self.sdk_shadow.shadowUpdate.assert_called_once()
+        on_update = self.sdk_shadow.shadowUpdate.call_args.args[1]
+        on_update('{"version": 4}', "accepted", "token")
+        self.assertEqual(self.spool.pending(), [])
+
+
+class InlinePublisher:
+    def submit(self, func, *args):
+        func(*args)
+
+
+@unittest.skipIf(iot_client is None, "AWSIoTPythonSDK isn't installed")
+class ShadowVersionTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        spool = Spool(os.path.join(directory.name, "spool.jsonl"))
+        self.addCleanup(spool.close)
+        self.sdk_shadow = mock.Mock()
+        self.shadow = iot_client.Shadow(self.sdk_shadow, "fresh-air", spool, InlinePublisher())
+        self.applied = []
+        self.synced = self.shadow.listen(self.applied.append, get=True)
+        self.on_get = self.sdk_shadow.shadowGet.call_args.args[0]
+        self.on_delta = self.sdk_shadow.shadowRegisterDeltaCallback.call_args.args[0]
+
+    def delta(self, state, version):
+        self.on_delta(json.dumps({ "state": { "state": state }, "version": version }), "delta", "token")
+
+    def test_stale_get_after_newer_delta(self):
+        self.delta("ON", 5)
+        self.on_get(json.dumps({ "state": { "desired": { "state": "OFF" } }, "version": 4 }), "accepted", "token")
+
+        self.assertTrue(self.synced.is_set())
+        self.assertEqual(self.applied, [True])
+        self.assertEqual(self.shadow.stats(), { 'version': 5, 'skipped': 1 })
+
+    def test_redelivered_delta(self):
+        self.on_get(json.dumps({ "state": { "desired": { "state": "OFF" } }, "version": 3 }), "accepted", "token")
+        self.delta("ON", 4)
+        self.delta("ON", 4)
+
+        self.assertEqual(self.applied, [False, True])
+        self.assertEqual(self.shadow.stats(), { 'version': 4, 'skipped': 1 })
+
+    def test_local_command_version_is_not_counted_as_skipped(self):
+        self.shadow.command(True)
+        on_update = self.sdk_shadow.shadowUpdate.call_args.args[1]
+
+        # The update is accepted at version 7, so the delta it raises is already applied
+        on_update(json.dumps({ "version": 7 }), "accepted", "token")
+        self.assertEqual(self.shadow.stats(), { 'version': 7, 'skipped': 0 })
+        self.delta("ON", 7)
+        self.assertEqual(self.applied, [True])
+
+        # A newer delta has been applied by the time an older update is accepted
+        self.shadow.command(False)
+        on_update = self.sdk_shadow.shadowUpdate.call_args.args[1]
+        self.delta("ON", 9)
+        on_update(json.dumps({ "version": 8 }), "accepted", "token")
+        self.assertEqual(self.applied, [True, False, True])
+        self.assertEqual(self.shadow.stats(), { 'version': 9, 'skipped': 1 })
+
+
+if __name__ == "__main__":
+    unittest.main()
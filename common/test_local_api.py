@@ -0,0 +1,85 @@
+import http.client
+import importlib
+import json
+import os
+import unittest
+from unittest import mock
+
+import local_api
+
+
+class Thing:
+    def __init__(self, thing_name):
+        self.thing_name = thing_name
+        self.reported = "OFF"
+        self.commands = []
+
+    def command(self, state):
+        self.commands.append(state)
+        return True
+
+
+class LocalApiTest(unittest.TestCase):
+    def setUp(self):
+        self.thing = Thing("garden-lights")
+        self.server = local_api.serve(0, lambda: { self.thing.thing_name: self.thing })
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+    def put(self, body, headers):
+        connection = http.client.HTTPConnection("127.0.0.1", self.server.server_port, timeout=5)
+        self.addCleanup(connection.close)
+        connection.putrequest("PUT", "/things/garden-lights")
+        for name, value in headers.items():
+            connection.putheader(name, value)
+        connection.endheaders(body)
+        response = connection.getresponse()
+        return response.status, json.loads(response.read())
+
+    def test_listens_on_loopback_by_default(self):
+        self.assertEqual(self.server.server_address[0], "127.0.0.1")
+
+    def test_command(self):
+        body = json.dumps({ "state": "ON" }).encode()
+        status, reply = self.put(body, { "Content-Length": str(len(body)) })
+        self.assertEqual(status, 202)
+        self.assertEqual(reply, { "thing": "garden-lights", "state": "ON" })
+        self.assertEqual(self.thing.commands, [True])
+
+    def test_malformed_content_length(self):
+        for length in ["ten", "-1"]:
+            with self.subTest(length=length):
+                status, _ = self.put(b'{"state": "ON"}', { "Content-Length": length })
+                self.assertEqual(status, 400)
+        self.assertEqual(self.thing.commands, [])
+
+    def test_oversized_body_is_not_read(self):
+        status, reply = self.put(b"", { "Content-Length": str(local_api.MAX_BODY + 1) })
+        self.assertEqual(status, 413)
+        self.assertEqual(self.thing.commands, [])
+
+
+class BindTest(unittest.TestCase):
+    def test_refuses_other_hosts_without_token(self):
+        with mock.patch.object(local_api, "_TOKEN", None):
+            with self.assertRaises(ValueError):
+                local_api.serve(0, dict, host="0.0.0.0")
+
+    def test_other_hosts_with_token(self):
+        with mock.patch.object(local_api, "_TOKEN", "secret"):
+            server = local_api.serve(0, dict, host="0.0.0.0")
+        server.shutdown()
+        server.server_close()
+        self.assertEqual(server.server_address[0], "0.0.0.0")
+
+    def test_empty_token_is_unset(self):
+        self.addCleanup(importlib.reload, local_api)
+        with mock.patch.dict(os.environ, { "LOCAL_API_TOKEN": "" }):
+            importlib.reload(local_api)
+        self.assertIsNone(local_api._TOKEN)
+        with self.assertRaises(ValueError):
+            local_api.serve(0, dict, host="0.0.0.0")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+import io
+import logging
+import queue
+import time
+import unittest
+from unittest import mock
+
+import logger
+from logger import BatchingStreamHandler
+
+
+def record(level, message):
+    return logging.makeLogRecord({ "name": "test", "levelno": level, "levelname": logging.getLevelName(level),
+                                   "msg": message })
+
+
+class BatchingStreamHandlerTest(unittest.TestCase):
+    def setUp(self):
+        self.stream = io.StringIO()
+        self.handler = BatchingStreamHandler(self.stream, batch_size=4)
+        self.handler.setFormatter(logging.Formatter("%(levelname)s %(message)s"))
+
+    def test_batches_until_full(self):
+        for i in range(3):
+            self.handler.handle(record(logging.INFO, f"info {i}"))
+        self.assertEqual(self.stream.getvalue(), "")
+        self.handler.handle(record(logging.INFO, "info 3"))
+        self.assertEqual(self.stream.getvalue().splitlines(), [f"INFO info {i}" for i in range(4)])
+
+    def test_warning_is_written_straight_away(self):
+        self.handler.handle(record(logging.INFO, "before"))
+        self.handler.handle(record(logging.WARNING, "warning"))
+        self.assertEqual(self.stream.getvalue().splitlines(), ["INFO before", "WARNING warning"])
+
+
+@mock.patch.object(logger, "BATCH_INTERVAL", 0.2)
+class BatchingQueueListenerTest(unittest.TestCase):
+    def test_flushes_an_interval_after_the_first_record(self):
+        stream = io.StringIO()
+        handler = BatchingStreamHandler(stream)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        log_queue = queue.SimpleQueue()
+        listener = logger._BatchingQueueListener(log_queue, handler)
+        listener.start()
+        self.addCleanup(listener.stop)
+
+        # Records keep arriving faster than the interval, so the queue is never idle for it
+        start = time.monotonic()
+        sent = 0
+        while not stream.getvalue():
+            self.assertLess(time.monotonic() - start, 1.0, "nothing written while records kept arriving")
+            log_queue.put(record(logging.INFO, f"info {sent}"))
+            sent += 1
+            time.sleep(0.05)
+        self.assertLess(time.monotonic() - start, 0.2 + 0.15)
+        self.assertEqual(stream.getvalue().splitlines()[0], "info 0")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+import threading
+import time
+import unittest
+from unittest import mock
+
+import pushover
+from pushover import PushoverClient
+
+
+class Response:
+    def __init__(self, status_code=200, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+    def json(self):
+        return { "status": 1, "request": "fake" }
+
+
+class FakeSession:
+    """
+    Records each post as (time, title, message) and answers with the queued
+    responses, then with 200
+    """
+    def __init__(self, responses=()):
+        self.posts = []
+        self.responses = list(responses)
+        self.lock = threading.Lock()
+
+    def post(self, url, timeout=None, data=None):
+        with self.lock:
+            self.posts.append((time.monotonic(), data["title"], data["message"]))
+            return self.responses.pop(0) if self.responses else Response()
+
+    def close(self):
+        pass
+
+
+class PushoverClientTest(unittest.TestCase):
+    def client(self, responses=(), **kwargs):
+        kwargs.setdefault("min_interval", 0.0)
+        client = PushoverClient(api_url="http://127.0.0.1:1/", **kwargs)
+        self.addCleanup(client.stop, 1)
+        client._session = self.session = FakeSession(responses)
+        return client
+
+    def messages(self):
+        return [(title, message) for _, title, message in self.session.posts]
+
+    def test_burst_is_one_digest(self):
+        client = self.client(digest_window=0.1)
+        for event in ["on", "off", "on"]:
+            client.notify("Garden", "Fairy Lights", event)
+        client.notify("Garden", "Path Lights", "on")
+        self.assertTrue(client.flush(5))
+        self.assertCountEqual(self.messages(), [("Garden", "Fairy Lights on, off, on"), ("Garden", "Path Lights on")])
+        stats = client.stats()
+        self.assertEqual((stats["sent"], stats["coalesced"], stats["pending"]), (2, 2, 0))
+
+    def test_oldest_is_dropped_when_too_many_are_queued(self):
+        client = self.client(digest_window=60, max_pending=2)
+        for subject in ["first", "second", "third"]:
+            client.notify("Garden", subject, "on")
+        self.assertTrue(client.flush(5))
+        self.assertEqual(self.messages(), [("Garden", "second on"), ("Garden", "third on")])
+        self.assertEqual(client.stats()["dropped"], 1)
+
+    def test_rate_limited_message_is_retried_after_the_reset(self):
+        reset = time.time() + 0.3
+        client = self.client([Response(429, { "X-Limit-App-Remaining": "0", "X-Limit-App-Reset": str(reset) })])
+        client.send("Fresh Air", "Windows opened")
+        self.assertTrue(client.flush(5))
+        self.assertEqual(self.messages(), [("Fresh Air", "Windows opened")] * 2)
+        self.assertGreaterEqual(self.session.posts[1][0] - self.session.posts[0][0], 0.2)
+        stats = client.stats()
+        self.assertEqual((stats["sent"], stats["failed"], stats["rate_limited"]), (1, 0, 1))
+
+    def test_rate_limited_digest_takes_later_events(self):
+        reset = time.time() + 0.3
+        client = self.client([Response(429, { "X-Limit-App-Reset": str(reset) })], digest_window=0.0)
+        client.notify("Garden", "Fairy Lights", "on")
+        deadline = time.monotonic() + 5
+        while client.stats()["rate_limited"] == 0:
+            if time.monotonic() > deadline:
+                raise AssertionError("the digest wasn't sent")
+            time.sleep(0.005)
+        client.notify("Garden", "Fairy Lights", "off")
+        self.assertTrue(client.flush(5))
+        self.assertEqual(self.messages(), [("Garden", "Fairy Lights on"), ("Garden", "Fairy Lights on, off")])
+
+    @mock.patch.object(pushover, "RETRY_DELAY", 0.2)
+    def test_rate_limited_without_reset_backs_off(self):
+        client = self.client([Response(429), Response(429)])
+        client.send("Fresh Air", "Windows closed")
+        self.assertTrue(client.flush(5))
+        times = [at for at, _, _ in self.session.posts]
+        self.assertEqual(len(times), 3)
+        self.assertGreaterEqual(times[1] - times[0], 0.15)
+        self.assertGreaterEqual(times[2] - times[1], 0.35)
+
+    def test_sending_waits_for_the_reset_when_none_remain(self):
+        reset = time.time() + 0.3
+        client = self.client([Response(200, { "X-Limit-App-Remaining": "0", "X-Limit-App-Reset": str(reset) })])
+        client.send("Fresh Air", "Windows opened")
+        client.send("Fresh Air", "Windows closed")
+        self.assertTrue(client.flush(5))
+        self.assertGreaterEqual(self.session.posts[1][0] - self.session.posts[0][0], 0.2)
+        self.assertEqual(client.stats()["remaining"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
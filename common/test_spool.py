@@ -0,0 +1,78 @@
+import json
+import os
+import tempfile
+import unittest
+
+from spool import Spool
+
+
+class SpoolTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "spool.jsonl")
+
+    def spool(self, **kwargs):
+        spool = Spool(self.path, **kwargs)
+        self.addCleanup(spool.close)
+        return spool
+
+    def test_round_trip(self):
+        spool = Spool(self.path)
+        garden = spool.put("garden-lights", { "state": "ON" })
+        windows = spool.put("fresh-air", { "state": "OFF" })
+        spool.put("fresh-air/desired", { "state": "OFF" })
+        spool.ack("fresh-air", windows)
+        spool.close()
+
+        spool = self.spool()
+        self.assertEqual(spool.pending(), [
+            ("garden-lights", garden, { "state": "ON" }),
+            ("fresh-air/desired", garden + 2, { "state": "OFF" })
+        ])
+        # Sequences carry on from where they were, so an old ack can't match a new put
+        self.assertGreater(spool.put("fresh-air", { "state": "ON" }), garden + 2)
+
+    def test_truncated_final_line(self):
+        with open(self.path, "w") as f:
+            f.write(json.dumps({ "key": "garden-lights", "seq": 1, "message": { "state": "ON" } }) + "\n")
+            f.write(json.dumps({ "key": "fresh-air", "seq": 2, "message": { "state": "ON" } }) + "\n")
+            f.write('{"key": "fresh-air", "ack": 2')
+
+        spool = self.spool()
+        self.assertEqual([key for key, _, _ in spool.pending()], ["garden-lights", "fresh-air"])
+
+        # The partial line is dropped when the spool is rewritten at load
+        with open(self.path) as f:
+            self.assertEqual(len([json.loads(line) for line in f]), 2)
+
+    def test_compaction(self):
+        spool = Spool(self.path, max_bytes=512)
+        for i in range(100):
+            spool.ack("garden-lights", spool.put("garden-lights", { "state": "ON" if i % 2 else "OFF" }))
+        waiting = spool.put("fresh-air", { "state": "ON" })
+
+        stats = spool.stats()
+        self.assertGreater(stats['compactions'], 0)
+        self.assertLessEqual(os.path.getsize(self.path), 512)
+        self.assertEqual(spool.pending(), [("fresh-air", waiting, { "state": "ON" })])
+
+        spool.close()
+        self.assertEqual(self.spool().pending(), [("fresh-air", waiting, { "state": "ON" })])
+
+    def test_stale_sequence(self):
+        spool = self.spool()
+        stale = spool.put("garden-lights", { "state": "ON" })
+        latest = spool.put("garden-lights", { "state": "OFF" })
+
+        self.assertFalse(spool.is_latest("garden-lights", stale))
+        self.assertTrue(spool.is_latest("garden-lights", latest))
+        self.assertEqual(spool.pending(), [("garden-lights", latest, { "state": "OFF" })])
+
+        # Acknowledging the replaced message leaves the newer one waiting
+        spool.ack("garden-lights", stale)
+        self.assertEqual(spool.pending(), [("garden-lights", latest, { "state": "OFF" })])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,8 @@
+"""
+The controllers import the shared modules directly, as the systemd units put
+common/ on PYTHONPATH; do the same for the tests
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "common"))
@@ -1,56 +1,167 @@
-import logging
+import gpio_backend
+import logger
+import os
+import state_store
+import threading
+import time
+from gpio_backend import HIGH, LOW
 
-logger = logging.getLogger("WindowController")
-logger.setLevel(logging.INFO)
-streamHandler = logging.StreamHandler()
-formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-streamHandler.setFormatter(formatter)
-logger.addHandler(streamHandler)
+_LOG = logger.create("WindowController", logger.INFO)
 
 
-try:
-  import RPi.GPIO as gpio
-  import time
+OPEN_WINDOWS_PIN = 23
+CLOSE_WINDOWS_PIN = 24
 
-  OPEN_WINDOWS_PIN = 23
-  CLOSE_WINDOWS_PIN = 24
+# How long a button is held, and the pause between presses so the remote sees them separately
+PRESS_TIME = 0.5
+RELEASE_TIME = 0.25
 
-  class WindowController:
-    def __enter__(self):
-      gpio.setwarnings(False)
-      gpio.setmode(gpio.BCM)
-      gpio.setup(OPEN_WINDOWS_PIN, gpio.OUT)
-      gpio.setup(CLOSE_WINDOWS_PIN, gpio.OUT)
-      gpio.output(OPEN_WINDOWS_PIN, gpio.LOW)
-      gpio.output(CLOSE_WINDOWS_PIN, gpio.LOW)
-      return self
+# How long the Velux motors take to fully open or close the windows
+TRAVEL_TIME = 25.0
 
-    def __exit__(self, *args):
-      gpio.cleanup()
+# How long after the motors stop the position last commanded is trusted. The
+# rain sensor or the wall remote can move the windows without us knowing, so
+# after this a command is always pressed.
+TRUST_TIME = 60.0
 
-    def push_button(self, pin):
-      gpio.output(pin, gpio.HIGH)
-      time.sleep(0.5)
-      gpio.output(pin, gpio.LOW)
+OPEN = "open"
+CLOSED = "closed"
 
-    def open_windows(self):
-      self.push_button(OPEN_WINDOWS_PIN)
+STATE_FILE = os.environ.get("WINDOW_STATE_FILE", "window-state.json")
 
-    def close_windows(self):
-      self.push_button(CLOSE_WINDOWS_PIN)
 
+class WindowController:
+  """
+  Window commands are queued for an actuator thread which pushes the remote's
+  buttons, so callers return straight away. Presses never overlap: a command
+  arriving during a press waits for the button to be released, and if several
+  arrive before the actuator is free only the latest is carried out.
 
-except:
-  class WindowController:
-    def __enter__(self):
-      logger.info("no RPi hardware found; using dev WindowController")
-      return self
+  The position last commanded is persisted, along with when the motors will
+  have finished moving, so a command for the position the windows are already
+  in or heading to is acknowledged without pressing anything. A command for
+  the other position while the motors are still moving is pressed, and the
+  motors are expected to take as long to return as they had been running.
+  The position is only trusted until TRUST_TIME after the motors stop, since
+  the windows may since have been moved by something else; after that every
+  command is pressed.
 
-    def __exit__(self, *args):
-      pass
+  The done callback passed with a command is called with whether a button
+  was pressed: on the actuator thread once the press has finished, or
+  straight away on the caller's thread when there was nothing to do. The
+  callback of a command replaced before it was carried out isn't called.
+  """
+  def __init__(self, gpio=None, state_file=STATE_FILE, open_pin=OPEN_WINDOWS_PIN, close_pin=CLOSE_WINDOWS_PIN):
+    self._gpio = gpio
+    self._open_pin = open_pin
+    self._close_pin = close_pin
+    self._state_file = state_file
+    self._condition = threading.Condition()
+    self._state = state_store.load(state_file, { "position": None, "moving_until": 0 })
+    self._pending = None
+    self._running = False
+    self._actuator = None
 
-    def open_windows(self):
-      logger.info("open")
+  def __enter__(self):
+    if self._gpio is None:
+      self._gpio = gpio_backend.create()
+    self._gpio.setup_outputs([self._open_pin, self._close_pin], LOW)
+    self._running = True
+    self._actuator = threading.Thread(target=self._actuate, name="window-actuator", daemon=True)
+    self._actuator.start()
+    return self
 
-    def close_windows(self):
-      logger.info("close")
+  def __exit__(self, *args):
+    with self._condition:
+      self._running = False
+      self._condition.notify()
+    self._actuator.join()
+    self._gpio.cleanup([self._open_pin, self._close_pin])
+
+  def get_state(self):
+    """
+    'open', 'closed', 'opening', 'closing', or None if not yet known
+    """
+    with self._condition:
+      position = self._state["position"]
+      if position is not None and time.time() < self._state["moving_until"]:
+        return "opening" if position == OPEN else "closing"
+      return position
+
+  def open_windows(self, done=None):
+    self._command(OPEN, self._open_pin, done)
+
+  def close_windows(self, done=None):
+    self._command(CLOSED, self._close_pin, done)
+
+  def _command(self, position, pin, done):
+    with self._condition:
+      known = self._known_position()
+      if self._pending is not None and position == known:
+        _LOG.info(f"{position}: cancelling pending {self._pending[0]} command")
+        self._pending = None
+        pressed = False
+      elif position == (self._pending or (known,))[0]:
+        _LOG.info(f"{position}: already commanded")
+        pressed = False
+      else:
+        _LOG.info(position)
+        self._pending = (position, pin, done)
+        self._condition.notify()
+        return
+
+    if done is not None:
+      done(pressed)
+
+  def _known_position(self):
+    """
+    The position last commanded, or None if it's too old to rely on
+    """
+    if time.time() > self._state["moving_until"] + TRUST_TIME:
+      return None
+    return self._state["position"]
+
+  def _actuate(self):
+    while True:
+      with self._condition:
+        self._condition.wait_for(lambda: self._pending is not None or not self._running)
+        if self._pending is None:
+          return
+        position, pin, done = self._pending
+        self._pending = None
+        self._update_state(position)
+
+      self._gpio.write(pin, HIGH)
+      released = time.monotonic() + PRESS_TIME
+      self._wait_until(released)
+      self._gpio.write(pin, LOW)
+
+      if done is not None:
+        try:
+          done(True)
+        except Exception as e:
+          _LOG.error(f"window command callback failed: {e}")
+
+      self._wait_until(released + RELEASE_TIME)
+
+  def _update_state(self, position):
+    now = time.time()
+    remaining = self._state["moving_until"] - now
+    if self._state["position"] is not None and remaining > 0:
+      # Reversing: getting back takes as long as the motors have run so far
+      travel = TRAVEL_TIME - remaining
+    else:
+      travel = TRAVEL_TIME
+    self._state = { "position": position, "moving_until": now + travel }
+    try:
+      state_store.save(self._state_file, self._state)
+    except OSError as e:
+      _LOG.error(f"unable to save window state: {e}")
+
+  def _wait_until(self, deadline):
+    # New commands only replace the pending one, so just wait out the time
+    while True:
+      remaining = deadline - time.monotonic()
+      if remaining <= 0:
+        return
+      time.sleep(remaining)
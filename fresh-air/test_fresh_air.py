@@ -0,0 +1,194 @@
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+import flight_recorder
+import fresh_air
+import window_devices
+from fresh_air import CLOSED, OPEN, WindowController
+from gpio_backend import HIGH, SimulatedBackend
+
+
+class Done:
+  """
+  A done callback which records what it was called with
+  """
+  def __init__(self):
+    self.calls = []
+    self.called = threading.Event()
+
+  def __call__(self, pressed):
+    self.calls.append(pressed)
+    self.called.set()
+
+  def wait(self):
+    if not self.called.wait(5):
+      raise AssertionError("done wasn't called")
+    return self.calls
+
+
+@mock.patch.object(fresh_air, "RELEASE_TIME", 0.02)
+@mock.patch.object(fresh_air, "PRESS_TIME", 0.1)
+class WindowControllerTest(unittest.TestCase):
+  def setUp(self):
+    directory = tempfile.TemporaryDirectory()
+    self.addCleanup(directory.cleanup)
+    self.state_file = os.path.join(directory.name, "window-state.json")
+    self.gpio = SimulatedBackend()
+
+  def controller(self, position=None, stopped_ago=0.0):
+    if position is not None:
+      with open(self.state_file, "w") as f:
+        json.dump({ "position": position, "moving_until": time.time() - stopped_ago }, f)
+    controller = WindowController(self.gpio, self.state_file, open_pin=5, close_pin=6)
+    self.enterContext(controller)
+    return controller
+
+  def presses(self, pin):
+    return [at for at, p, value in self.gpio.trace if p == pin and value == HIGH]
+
+  def wait_for_press(self, pin):
+    deadline = time.monotonic() + 5
+    while not self.presses(pin):
+      if time.monotonic() > deadline:
+        raise AssertionError(f"pin {pin} wasn't pressed")
+      time.sleep(0.001)
+
+  def saved_state(self):
+    with open(self.state_file) as f:
+      return json.load(f)
+
+  def test_already_commanded_is_not_pressed(self):
+    controller = self.controller(OPEN)
+    done = Done()
+    controller.open_windows(done)
+    self.assertEqual(done.calls, [False])
+    self.assertEqual(self.presses(5), [])
+
+  def test_stale_position_is_pressed(self):
+    controller = self.controller(OPEN, stopped_ago=fresh_air.TRUST_TIME + 1)
+    done = Done()
+    controller.open_windows(done)
+    self.assertEqual(done.wait(), [True])
+    self.assertEqual(len(self.presses(5)), 1)
+    self.assertEqual(self.saved_state()["position"], OPEN)
+
+  def test_cancel_pending(self):
+    controller = self.controller(CLOSED)
+    opened = Done()
+    controller.open_windows(opened)
+    self.wait_for_press(5)
+
+    # The close waits for the open press to be released, and is then
+    # cancelled by another open before it's carried out
+    closed = Done()
+    controller.close_windows(closed)
+    reopened = Done()
+    controller.open_windows(reopened)
+
+    self.assertEqual(reopened.calls, [False])
+    self.assertEqual(opened.wait(), [True])
+    time.sleep(fresh_air.PRESS_TIME + fresh_air.RELEASE_TIME)
+    self.assertEqual(closed.calls, [])
+    self.assertEqual(self.presses(6), [])
+    self.assertEqual(len(self.presses(5)), 1)
+
+  def test_reverse_while_moving(self):
+    controller = self.controller(CLOSED)
+    opened = Done()
+    controller.open_windows(opened)
+    opened.wait()
+    self.assertEqual(controller.get_state(), "opening")
+
+    closed = Done()
+    controller.close_windows(closed)
+    self.assertEqual(closed.wait(), [True])
+    self.assertEqual(len(self.presses(6)), 1)
+    self.assertEqual(controller.get_state(), "closing")
+
+    # The motors only ran for about a press, so should take about that long to return
+    state = self.saved_state()
+    self.assertEqual(state["position"], CLOSED)
+    self.assertLess(state["moving_until"] - time.time(), 1.0)
+
+
+class FakeShadow:
+  """
+  A shadow which keeps the delta callback and marks reports as the real one does
+  """
+  def __init__(self, thing):
+    self.thing = thing
+    self.callback = None
+    self.reported = []
+
+  def listen(self, callback):
+    self.callback = callback
+
+  def report(self, state):
+    self.reported.append(state)
+    flight_recorder.RECORDER.mark(self.thing, 'reported')
+
+
+class FakeIoT:
+  def __init__(self):
+    self.shadows = {}
+
+  def shadow(self, thing):
+    return self.shadows.setdefault(thing, FakeShadow(thing))
+
+
+@mock.patch.object(fresh_air, "RELEASE_TIME", 0.02)
+@mock.patch.object(fresh_air, "PRESS_TIME", 0.1)
+@mock.patch.object(window_devices.pushover, "notify")
+@mock.patch.object(flight_recorder, "RECORDER", new_callable=flight_recorder.FlightRecorder)
+class WindowDevicesTest(unittest.TestCase):
+  def setUp(self):
+    directory = tempfile.TemporaryDirectory()
+    self.addCleanup(directory.cleanup)
+    self.state_file = os.path.join(directory.name, "window-state.json")
+    self.enterContext(mock.patch.dict(os.environ, { "GPIO_BACKEND": "sim" }))
+    self.iot = FakeIoT()
+
+  def listen(self, position=None):
+    if position is not None:
+      with open(self.state_file, "w") as f:
+        json.dump({ "position": position, "moving_until": time.time() }, f)
+    devices = window_devices.WindowDevices(self.iot, {
+      "thing": "windows", "state_file": self.state_file, "pins": { "open": 5, "close": 6 }
+    })
+    self.enterContext(devices)
+    devices.listen()
+    return self.iot.shadow("windows")
+
+  def stages(self, recorder):
+    [record] = recorder.recent()
+    return [stage for stage, _ in record["stages"]]
+
+  def test_acknowledged_command_is_queued_before_reported(self, recorder, notify):
+    shadow = self.listen(CLOSED)
+    recorder.begin("windows", False)
+    shadow.callback(False)
+    self.assertEqual(shadow.reported, [False])
+    self.assertEqual(self.stages(recorder), ['received', 'queued', 'reported'])
+    notify.assert_not_called()
+
+  def test_pressed_command_marks_each_stage(self, recorder, notify):
+    shadow = self.listen()
+    recorder.begin("windows", True)
+    shadow.callback(True)
+    deadline = time.monotonic() + 5
+    while not shadow.reported:
+      if time.monotonic() > deadline:
+        raise AssertionError("the windows weren't reported")
+      time.sleep(0.001)
+    self.assertEqual(shadow.reported, [True])
+    self.assertEqual(self.stages(recorder), ['received', 'queued', 'switched', 'hook', 'reported'])
+    notify.assert_called_once_with("Fresh Air", "Windows", "opened")
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,59 @@
+import flight_recorder
+import fresh_air
+import logger
+import pushover
+
+
+_LOG = logger.create("window_devices", logger.INFO)
+
+
+class WindowDevices:
+  """
+  The remote control buttons for a set of windows, as one thing, shared by the
+  fresh air listener and the home daemon. Entering it sets up the buttons;
+  listen() then subscribes to the shadow once connected.
+  """
+  def __init__(self, iot, config):
+    pins = config.get("pins", {})
+    self.name = config.get("name", "Fresh Air")
+    self._thing = config["thing"]
+    self._iot = iot
+    self._controller = fresh_air.WindowController(
+      state_file=config.get("state_file", fresh_air.STATE_FILE),
+      open_pin=pins.get("open", fresh_air.OPEN_WINDOWS_PIN),
+      close_pin=pins.get("close", fresh_air.CLOSE_WINDOWS_PIN))
+
+  def __enter__(self):
+    self._controller.__enter__()
+    return self
+
+  def __exit__(self, *args):
+    return self._controller.__exit__(*args)
+
+  def listen(self):
+    thing = self._thing
+    shadow = self._iot.shadow(thing)
+
+    def callback(state):
+      # Runs on the MQTT callback thread, so only queue the press; the
+      # notification and report follow on the actuator thread, unless
+      # the windows are already there and it's only acknowledged, in which
+      # case done is called before the controller returns
+      def done(pressed):
+        if pressed:
+          flight_recorder.RECORDER.mark(thing, 'switched')
+          pushover.notify(self.name, "Windows", "opened" if state else "closed")
+          flight_recorder.RECORDER.mark(thing, 'hook')
+        shadow.report(state)
+
+      flight_recorder.RECORDER.mark(thing, 'queued')
+      if state:
+        self._controller.open_windows(done)
+      else:
+        self._controller.close_windows(done)
+
+    shadow.listen(callback)
+    _LOG.info(f"Created handler for {self.name}")
+
+  def stats(self):
+    return { 'position': self._controller.get_state() }
@@ -1,13 +1,22 @@
 
-import RPi.GPIO as gpio
+import heapq
+import itertools
+from flight_recorder import RECORDER
+from hook_dispatcher import HookDispatcher
+from collections import deque
 import logger
+import os
+import state_store
 import threading
 import time
 from enum import Enum
-from queue import Queue, Empty
+from queue import Empty
+import gpio_backend
+from gpio_backend import HIGH, LOW
 
 
 _LOG = logger.create("garden_controller", logger.INFO)
+_GPIO = gpio_backend.create()
 
 _ZONES = {
     'garden-lights': {
@@ -20,30 +29,182 @@ _ZONES = {
 READY_PIN = 23
 SWITCH_PIN = 17
 ON_DELAY = 2.0
+DEBOUNCE_TIME = 0.05
+
+STATE_FILE = os.environ.get("GARDEN_STATE_FILE", "garden-state.json")
 
 class Event(Enum):
     ON = "on"
     OFF = "off"
     EXIT = "exit"
     SET_HOOK = "hook"
+    SWITCH = "switch"
+
+
+class SwitchDebouncer:
+    """
+    Turns GPIO edge callbacks from a bouncing mechanical switch into single
+    level changes. The first edge is reported straight away, then further edges
+    are ignored for DEBOUNCE_TIME, after which the level is read again in case
+    it settled somewhere else.
+    """
+    def __init__(self, pin, on_change, debounce_time=DEBOUNCE_TIME):
+        self._pin = pin
+        self._on_change = on_change
+        self._debounce_time = debounce_time
+        self._lock = threading.Lock()
+        self._level = self._read()
+        self._settling = False
+
+    def start(self):
+        _GPIO.add_edge_callback(self._pin, self._on_edge)
+
+    def stop(self):
+        _GPIO.remove_edge_callback(self._pin)
+
+    def _read(self):
+        return _GPIO.read(self._pin) != 0
+
+    def _on_edge(self, pin):
+        with self._lock:
+            if self._settling:
+                return
+            self._settling = True
+        timer = threading.Timer(self._debounce_time, self._settled)
+        timer.daemon = True
+        timer.start()
+        self._update()
+
+    def _settled(self):
+        with self._lock:
+            self._settling = False
+        self._update()
+
+    def _update(self):
+        level = self._read()
+        with self._lock:
+            changed = level != self._level
+            self._level = level
+        if changed:
+            self._on_change(level)
+
+
+class ControlQueue:
+    """
+    The control thread's mailbox. Events are delivered in order, except that
+    lights states are coalesced: while an ON or OFF for a zone is waiting, a
+    newer one replaces it in place, so a burst of changes is applied once as
+    the latest desired state.
+    """
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._events = deque()
+        self._desired = {}
+        self._coalesced = 0
+        self._delivered = 0
+
+    def put(self, event):
+        with self._condition:
+            self._events.append(event)
+            self._condition.notify()
+
+    def put_lights_state(self, zone, state):
+        with self._condition:
+            if zone in self._desired:
+                self._coalesced += 1
+            else:
+                self._events.append((None, zone))
+                self._condition.notify()
+            self._desired[zone] = state
+
+    def get(self, timeout=None):
+        """
+        The next event, or raise Empty if none arrives within the timeout
+        """
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._events, timeout):
+                raise Empty()
+            event = self._events.popleft()
+            if event[0] is None:
+                zone = event[1]
+                event = (Event.ON if self._desired.pop(zone) else Event.OFF, zone)
+            self._delivered += 1
+            return event
+
+    def stats(self):
+        with self._condition:
+            return {
+                'depth': len(self._events),
+                'delivered': self._delivered,
+                'coalesced': self._coalesced
+            }
+
+
+class Scheduler:
+    """
+    Timers run on the control thread between events, so that slow sequences
+    like the staggered power-on don't block the thread with sleeps
+    """
+    def __init__(self):
+        self._timers = []
+        self._sequence = itertools.count()
+
+    def call_later(self, delay, func, *args):
+        timer = [time.monotonic() + delay, next(self._sequence), func, args, False]
+        heapq.heappush(self._timers, timer)
+        return timer
+
+    def cancel(self, timer):
+        timer[4] = True
+
+    def timeout(self):
+        """
+        Seconds until the next timer is due, or None if there are none
+        """
+        while self._timers and self._timers[0][4]:
+            heapq.heappop(self._timers)
+        if not self._timers:
+            return None
+        return max(0.0, self._timers[0][0] - time.monotonic())
+
+    def run_due(self):
+        now = time.monotonic()
+        while self._timers and self._timers[0][0] <= now:
+            _, _, func, args, cancelled = heapq.heappop(self._timers)
+            if not cancelled:
+                func(*args)
 
 
 class ControlThread(threading.Thread):
-    def __init__(self):
+    """
+    The lights state of each zone is snapshotted to state_file whenever it
+    changes, and restored at startup, so the shadow only has to correct any
+    difference. Pins of a lit zone which are still on, as after a restart
+    following a failure, are left as they are so the lights don't blink; any
+    which are off, as after a clean exit or a power cut, are ramped up with
+    the usual stagger. A clean exit turns the lights off but keeps the
+    snapshot, so they come back as they were at the next start. An exit after
+    a failure leaves the pins alone for the restart to take over.
+    """
+    def __init__(self, zones, state_file=STATE_FILE, ready_pin=READY_PIN, switch_pin=SWITCH_PIN):
         threading.Thread.__init__(self)
+        self._zones = zones
+        self._state_file = state_file
+        self._ready_pin = ready_pin
+        self._switch_pin = switch_pin
 
-        gpio.setwarnings(False)
-        gpio.setmode(gpio.BCM)
-        gpio.setup(READY_PIN, gpio.OUT)
-        gpio.setup(SWITCH_PIN, gpio.IN, pull_up_down=gpio.PUD_UP)
-        gpio.output(READY_PIN, gpio.HIGH)
+        snapshot = state_store.load(state_file, {}).get("lights", {})
+        self._lights_state = { zone: bool(snapshot.get(zone, False)) for zone in zones.keys() }
 
-        for zone in _ZONES.values():
-            for pin in zone['control-pins']:
-                gpio.setup(pin, gpio.OUT)
-                gpio.output(pin, gpio.LOW)
+        _GPIO.setup_output(ready_pin, HIGH)
+        _GPIO.setup_input(switch_pin, pull_up=True)
 
-        self._queue = Queue()
+        for name, zone in zones.items():
+            _GPIO.setup_outputs(zone['control-pins'], None if self._lights_state[name] else LOW)
+
+        self._queue = ControlQueue()
+        self._hooks = HookDispatcher()
+        self._switch = SwitchDebouncer(switch_pin, self._on_switch)
 
 
     @logger.log_with(_LOG)
@@ -53,31 +214,65 @@ class ControlThread(threading.Thread):
 
     @logger.log_with(_LOG)
     def set_lights_state(self, zone, state):
-        event = Event.ON if state else Event.OFF
-        self._queue.put((event, zone))
+        self._queue.put_lights_state(zone, state)
+        RECORDER.mark(zone, 'queued')
+
+
+    def get_queue_stats(self):
+        return self._queue.stats()
+
+
+    def get_hook_stats(self):
+        return self._hooks.stats()
+
+
+    def _on_switch(self, state):
+        self._queue.put((Event.SWITCH, state))
 
 
     @logger.log_with(_LOG)
-    def exit(self):
+    def exit(self, lights_off=True):
+        self._switch.stop()
         self._queue.put((Event.EXIT,))
         self.join()
+        self._hooks.stop()
+
+        if not lights_off:
+            _LOG.info(f"leaving lights {self._lights_state} for the restart")
+            return
 
-        gpio.output(READY_PIN, gpio.LOW)
-        for zone in _ZONES.values():
-          for pin in zone['control-pins']:
-            gpio.output(pin, gpio.LOW)
-        gpio.cleanup()
+        _GPIO.write(self._ready_pin, LOW)
+        pins = [self._ready_pin, self._switch_pin]
+        for zone in self._zones.values():
+            _GPIO.write_many(zone['control-pins'], LOW)
+            pins.extend(zone['control-pins'])
+        # Only this controller's pins, as others may share the Pi
+        _GPIO.cleanup(pins)
 
 
     def run(self):
         _LOG.debug("Starting control thread")
-        self._switch_state = self._read_switch()
-        self._lights_state = { zone: False for zone in _ZONES.keys() }
-        self._update_hooks = { zone: None for zone in _ZONES.keys() }
+        self._update_hooks = { zone: None for zone in self._zones.keys() }
+        self._ramps = { zone: [] for zone in self._zones.keys() }
+        self._scheduler = Scheduler()
+        for zone, state in self._lights_state.items():
+            if state:
+                self._ramp_up(zone)
+        _LOG.info(f"restored lights {self._lights_state}")
+        self._switch.start()
 
         while True:
             try:
-                event, *args = self._queue.get(block=True, timeout=1)
+                self._scheduler.run_due()
+            except Exception as e:
+                _LOG.error(f"unable to run timer: {e}")
+
+            try:
+                event, *args = self._queue.get(timeout=self._scheduler.timeout())
+            except Empty:
+                continue
+
+            try:
                 _LOG.debug(f"handling event {event} {args}")
 
                 if event == Event.EXIT:
@@ -92,15 +287,15 @@ class ControlThread(threading.Thread):
                 elif event == Event.SET_HOOK:
                     self._update_hooks[args[0]] = args[1]
 
+                elif event == Event.SWITCH:
+                    # The switch toggles the first zone whichever way it moves
+                    zone = next(iter(self._zones))
+                    RECORDER.begin(zone, 'switch')
+                    self._toggle_lights(zone)
+
                 else:
                     _LOG.error(f"unknown event {event} for {args}")
 
-            except Empty:
-                switch = self._read_switch()
-                if switch != self._switch_state:
-                  self._switch_state = switch
-                  self._toggle_lights(_ZONES.keys()[0])
-
             except Exception as e:
                 _LOG.error(f"unable to process event {event} for {args}: {e}")
 
@@ -110,10 +305,9 @@ class ControlThread(threading.Thread):
         if not self._lights_state[zone]:
             self._invoke_hook(zone, True)
             self._lights_state[zone] = True
-            for pin in _ZONES[zone]['control-pins']:
-                _LOG.debug(f"pin {pin} on")
-                gpio.output(pin, gpio.HIGH)
-                time.sleep(ON_DELAY)
+            self._ramp_up(zone)
+            RECORDER.mark(zone, 'switched')
+            self._save_state()
 
 
     @logger.log_with(_LOG)
@@ -121,9 +315,35 @@ class ControlThread(threading.Thread):
         if self._lights_state[zone]:
             self._invoke_hook(zone, False)
             self._lights_state[zone] = False
-            for pin in _ZONES[zone]['control-pins']:
-                _LOG.debug(f"pin {pin} off")
-                gpio.output(pin, gpio.LOW)
+            for timer in self._ramps[zone]:
+                self._scheduler.cancel(timer)
+            self._ramps[zone] = []
+            _LOG.debug(f"pins {self._zones[zone]['control-pins']} off")
+            _GPIO.write_many(self._zones[zone]['control-pins'], LOW)
+            RECORDER.mark(zone, 'switched')
+            self._save_state()
+
+
+    def _ramp_up(self, zone):
+        # Stagger the pins which are off ON_DELAY apart without holding up the thread
+        pins = [pin for pin in self._zones[zone]['control-pins'] if _GPIO.read(pin) == LOW]
+        self._ramps[zone] = [
+            self._scheduler.call_later(i * ON_DELAY, self._pin_on, pin)
+            for i, pin in enumerate(pins)
+        ]
+        self._scheduler.run_due()
+
+
+    def _save_state(self):
+        try:
+            state_store.save(self._state_file, { "lights": self._lights_state })
+        except OSError as e:
+            _LOG.error(f"unable to save lights state: {e}")
+
+
+    def _pin_on(self, pin):
+        _LOG.debug(f"pin {pin} on")
+        _GPIO.write(pin, HIGH)
 
 
     @logger.log_with(_LOG)
@@ -138,28 +358,35 @@ class ControlThread(threading.Thread):
     def _invoke_hook(self, zone, state):
         hook = self._update_hooks[zone]
         if hook is not None:
-            hook(state)
+            self._hooks.submit(zone, hook, state)
 
 
-    def _read_switch(self):
-        return gpio.input(SWITCH_PIN) != 0
 
+class GardenController:
+    def __init__(self, zones=None, state_file=STATE_FILE, ready_pin=READY_PIN, switch_pin=SWITCH_PIN):
+        self._zones = zones if zones is not None else _ZONES
+        self._state_file = state_file
+        self._ready_pin = ready_pin
+        self._switch_pin = switch_pin
 
 
-class GardenController:
     def __enter__(self):
-        self._controller = ControlThread()
+        self._controller = ControlThread(self._zones, self._state_file, self._ready_pin, self._switch_pin)
         self._controller.start()
         return self
 
 
-    def __exit__(self, *args):
-        self._controller.exit()
+    def __exit__(self, exc_type, exc_value, traceback):
+        # Only a deliberate stop turns the lights off. After a failure, such
+        # as a connect timeout, they stay as they are for the restart, rather
+        # than cycling off and on again with every attempt.
+        deliberate = exc_type is None or issubclass(exc_type, KeyboardInterrupt)
+        self._controller.exit(lights_off=deliberate)
         self._controller = None
 
 
     def get_zones(self):
-        return _ZONES
+        return self._zones
 
 
     def set_update_hook(self, zone, hook):
@@ -174,6 +401,14 @@ class GardenController:
         self._controller.set_lights_state(zone, False)
 
 
+    def get_queue_stats(self):
+        return self._controller.get_queue_stats()
+
+
+    def get_hook_stats(self):
+        return self._controller.get_hook_stats()
+
+
 if __name__ == "__main__":
     with GardenController():
         try:
@@ -0,0 +1,83 @@
+"""
+The garden lights controller as IoT things, one for each zone, shared by the
+garden's own listener and the home daemon
+"""
+import flight_recorder
+import garden_controller
+import logger
+import pushover
+
+
+_LOG = logger.create("garden_devices", logger.INFO)
+
+
+class DeviceAdapter:
+    def __init__(self, endpoint, name, client_name, garden_controller):
+        self._endpoint = str(endpoint)
+        self._name = str(name)
+        self._client_name = client_name
+        self._garden_controller = garden_controller
+        self._update_hook = None
+
+    def __repr__(self):
+        return f'DeviceAdapter[{self._endpoint}]'
+
+    @logger.log_with(_LOG)
+    def set_update_hook(self, hook):
+        self._update_hook = hook
+
+    @logger.log_with(_LOG)
+    def shadow_to_device(self, state):
+        if state:
+            self._garden_controller.lights_on(self._endpoint)
+        else:
+            self._garden_controller.lights_off(self._endpoint)
+
+    @logger.log_with(_LOG)
+    def device_to_shadow(self, state):
+        flight_recorder.RECORDER.mark(self._endpoint, 'hook')
+        pushover.notify(self._client_name, self._name, 'on' if state else 'off')
+        self._update_hook(state)
+
+
+class GardenDevices:
+    """
+    A garden lights controller, with a thing for each of its zones. Entering
+    it restores the lights and wires each zone to its shadow; listen() then
+    subscribes once connected.
+    """
+    def __init__(self, iot, config):
+        pins = config.get("pins", {})
+        self.name = config.get("name", "Garden Controller")
+        self._iot = iot
+        self._controller = garden_controller.GardenController(
+            config.get("zones"), config.get("state_file", garden_controller.STATE_FILE),
+            ready_pin=pins.get("ready", garden_controller.READY_PIN),
+            switch_pin=pins.get("switch", garden_controller.SWITCH_PIN))
+        self._handlers = {}
+
+    def __enter__(self):
+        self._controller.__enter__()
+        for endpoint, zone in self._controller.get_zones().items():
+            friendly_name = zone['friendly_name']
+            adapter = DeviceAdapter(endpoint, friendly_name, self.name, self._controller)
+            adapter.set_update_hook(self._iot.shadow(endpoint).report)
+            self._controller.set_update_hook(endpoint, adapter.device_to_shadow)
+            self._handlers[endpoint] = adapter.shadow_to_device
+            _LOG.info(f"Created handler for {friendly_name}")
+        return self
+
+    def __exit__(self, *args):
+        return self._controller.__exit__(*args)
+
+    def listen(self):
+        # Subscribe and get every zone's state at once, rather than a round trip each in turn
+        missing = self._iot.listen_all(self._handlers)
+        if missing:
+            _LOG.warning(f"no initial state for {missing}; waiting for deltas")
+
+    def stats(self):
+        return {
+            'queue': self._controller.get_queue_stats(),
+            'hooks': self._controller.get_hook_stats()
+        }
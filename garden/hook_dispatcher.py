@@ -0,0 +1,149 @@
+import logger
+import threading
+import time
+from collections import deque
+
+
+_LOG = logger.create("hook_dispatcher", logger.INFO)
+
+DROP_OLDEST = "drop-oldest"
+DROP_NEWEST = "drop-newest"
+
+
+class HookDispatcher:
+    """
+    Runs update hooks on background worker threads, so the GPIO control thread
+    only ever enqueues and never waits on network I/O. A call which runs longer
+    than its timeout can't be interrupted, but it is reported and counted, and
+    the other workers carry on. Calls with the same name run one at a time in
+    the order submitted, so a zone's reported states can't overtake each other.
+
+    The queue of pending calls is bounded. A call with the same name as one
+    already waiting supersedes it, as a zone's latest state does its earlier
+    ones, so when the queue is full the newer call takes the older one's
+    place. Otherwise a waiting call which a later one of its name supersedes
+    is dropped, so that no name loses its only call. Only when every waiting
+    call is the last of its name is either the oldest or the new one dropped.
+    """
+    def __init__(self, workers=2, max_pending=16, timeout=10.0, overflow=DROP_OLDEST):
+        self._max_pending = max_pending
+        self._timeout = timeout
+        self._overflow = overflow
+        self._condition = threading.Condition()
+        self._pending = deque()
+        self._stats = {}
+        self._dropped = 0
+        self._replaced = 0
+        self._busy = set()
+        self._running = True
+        self._workers = [threading.Thread(target=self._work, name=f"hook-{i}", daemon=True) for i in range(workers)]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, name, hook, *args, timeout=None):
+        call = (name, hook, args, self._timeout if timeout is None else timeout, time.monotonic())
+        with self._condition:
+            if len(self._pending) >= self._max_pending:
+                if self._replace(call):
+                    return
+                self._dropped += 1
+                index = self._superseded()
+                if index is None:
+                    if self._overflow == DROP_NEWEST:
+                        _LOG.warning(f"hook queue full; dropping call to {name}")
+                        return
+                    index = 0
+                dropped = self._pending[index]
+                del self._pending[index]
+                _LOG.warning(f"hook queue full; dropping call to {dropped[0]}")
+            self._pending.append(call)
+            self._condition.notify()
+
+    def stop(self):
+        """
+        Stop once the calls already queued have run
+        """
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        for worker in self._workers:
+            worker.join()
+
+    def stats(self):
+        with self._condition:
+            return {
+                'pending': len(self._pending),
+                'dropped': self._dropped,
+                'replaced': self._replaced,
+                'hooks': { name: dict(stats) for name, stats in self._stats.items() }
+            }
+
+    def _replace(self, call):
+        """
+        Put call in place of the latest waiting call with its name, if any
+        """
+        for index in range(len(self._pending) - 1, -1, -1):
+            if self._pending[index][0] == call[0]:
+                self._pending[index] = call
+                self._replaced += 1
+                return True
+        return False
+
+    def _superseded(self):
+        """
+        The index of the oldest waiting call with a later one of the same
+        name behind it, or None
+        """
+        later = set()
+        superseded = None
+        for index in range(len(self._pending) - 1, -1, -1):
+            name = self._pending[index][0]
+            if name in later:
+                superseded = index
+            later.add(name)
+        return superseded
+
+    def _next_call(self):
+        for call in self._pending:
+            if call[0] not in self._busy:
+                return call
+        return None
+
+    def _work(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(
+                    lambda: self._next_call() is not None or not (self._running or self._pending))
+                call = self._next_call()
+                if call is None:
+                    return
+                self._pending.remove(call)
+                name, hook, args, timeout, queued = call
+                self._busy.add(name)
+
+            start = time.monotonic()
+            try:
+                hook(*args)
+                failed = False
+            except Exception as e:
+                _LOG.error(f"hook {name} failed: {e}")
+                failed = True
+            elapsed = time.monotonic() - start
+
+            if elapsed > timeout:
+                _LOG.warning(f"hook {name} took {elapsed:.2f}s, over its {timeout:.2f}s timeout")
+            self._record(name, start - queued, elapsed, elapsed > timeout, failed)
+
+    def _record(self, name, waited, elapsed, timed_out, failed):
+        with self._condition:
+            stats = self._stats.setdefault(name, {
+                'calls': 0, 'failed': 0, 'timed_out': 0, 'total_time': 0.0, 'max_time': 0.0, 'max_wait': 0.0
+            })
+            stats['calls'] += 1
+            stats['failed'] += 1 if failed else 0
+            stats['timed_out'] += 1 if timed_out else 0
+            stats['total_time'] += elapsed
+            stats['max_time'] = max(stats['max_time'], elapsed)
+            stats['max_wait'] = max(stats['max_wait'], waited)
+            self._busy.discard(name)
+            self._condition.notify_all()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Time commands through the local API to the garden lights, using the
+simulated GPIO backend: the HTTP round trip, and how long until a control pin
+actually moved
+"""
+import os
+import tempfile
+import time
+
+os.environ['GPIO_BACKEND'] = 'sim'
+
+import garden_controller
+import local_api
+from bench_local_api import LocalApiClient, summarise
+
+
+class Zone:
+    """
+    Stands in for a zone's shadow, as the local API sees it
+    """
+    def __init__(self, controller, zone):
+        self.thing_name = zone
+        self.reported = None
+        self._controller = controller
+        controller.set_update_hook(zone, self._report)
+
+    def command(self, state):
+        if state:
+            self._controller.lights_on(self.thing_name)
+        else:
+            self._controller.lights_off(self.thing_name)
+        return True
+
+    def _report(self, state):
+        self.reported = "ON" if state else "OFF"
+
+
+def actuation(gpio, pins, seen, start):
+    """
+    Seconds from start until the first control pin write after the trace's
+    seen'th entry
+    """
+    while True:
+        for at, pin, value in gpio.trace[seen:]:
+            if pin in pins:
+                return at - start
+        time.sleep(0.0002)
+
+
+if __name__ == "__main__":
+    garden_controller.ON_DELAY = 0.01
+    # Keep the simulated lights out of the real garden-state.json
+    directory = tempfile.TemporaryDirectory()
+    state_file = os.path.join(directory.name, "garden-state.json")
+    with directory, garden_controller.GardenController(state_file=state_file) as controller:
+        zone = next(iter(controller.get_zones()))
+        things = { zone: Zone(controller, zone) }
+        server = local_api.serve(0, lambda: things, host='127.0.0.1')
+        client = LocalApiClient(f"http://127.0.0.1:{server.server_port}")
+
+        gpio = garden_controller._GPIO
+        pins = controller.get_zones()[zone]['control-pins']
+        round_trips = []
+        actuations = []
+        for i in range(50):
+            seen = len(gpio.trace)
+            start = time.monotonic()
+            client.command(zone, "ON" if i % 2 == 0 else "OFF")
+            round_trips.append(time.monotonic() - start)
+            actuations.append(actuation(gpio, pins, seen, start))
+            time.sleep(0.05)
+
+        client.close()
+        server.shutdown()
+        summarise("command round trip", round_trips)
+        summarise("command to first pin", actuations)
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Time how long a bouncing press of the garden switch takes to reach the
+lights, using the simulated GPIO backend
+"""
+import os
+import tempfile
+import threading
+import time
+
+os.environ['GPIO_BACKEND'] = 'sim'
+
+import garden_controller
+from gpio_backend import HIGH, LOW
+
+
+def bounce(gpio, pin, value, bounces=5, interval=0.001):
+    """
+    Move an input to a new level the way a mechanical switch does, chattering
+    between levels a few times first, on a thread of its own as edge
+    callbacks would arrive
+    """
+    def run():
+        for _ in range(bounces):
+            gpio.set_input(pin, value)
+            time.sleep(interval)
+            gpio.set_input(pin, HIGH - value)
+            time.sleep(interval)
+        gpio.set_input(pin, value)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+
+def press(level):
+    """
+    Bounce the switch to a level and return the seconds until a control pin moved
+    """
+    gpio = garden_controller._GPIO
+    pins = next(iter(garden_controller._ZONES.values()))['control-pins']
+    seen = len(gpio.trace)
+    start = time.monotonic()
+    bounce(gpio, garden_controller.SWITCH_PIN, level).join()
+    while True:
+        for at, pin, value in gpio.trace[seen:]:
+            if pin in pins:
+                return at - start
+        time.sleep(0.0005)
+
+
+if __name__ == "__main__":
+    garden_controller.ON_DELAY = 0.01
+    # Keep the simulated lights out of the real garden-state.json
+    directory = tempfile.TemporaryDirectory()
+    state_file = os.path.join(directory.name, "garden-state.json")
+    with directory, garden_controller.GardenController(state_file=state_file):
+        time.sleep(0.1)
+        for i in range(10):
+            latency = press(LOW if i % 2 == 0 else HIGH)
+            print(f"press {i}: {latency * 1000:.1f}ms")
+            time.sleep(0.2)
@@ -0,0 +1,216 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+from queue import Empty
+from unittest import mock
+
+import garden_controller
+from garden_controller import ControlQueue, Event, GardenController, Scheduler
+from gpio_backend import HIGH, LOW, SimulatedBackend
+
+
+ZONES = {
+    'garden-lights': {
+        'friendly_name': 'Garden Fairy Lights',
+        'control-pins': [14, 15, 24, 25]
+    }
+}
+PINS = ZONES['garden-lights']['control-pins']
+
+
+class ControlQueueTest(unittest.TestCase):
+    def test_burst_is_coalesced_to_the_last_state(self):
+        queue = ControlQueue()
+        for i in range(10):
+            queue.put_lights_state("garden-lights", i % 2 == 0)
+        self.assertEqual(queue.stats(), { 'depth': 1, 'delivered': 0, 'coalesced': 9 })
+
+        self.assertEqual(queue.get(0), (Event.OFF, "garden-lights"))
+        with self.assertRaises(Empty):
+            queue.get(0)
+        self.assertEqual(queue.stats(), { 'depth': 0, 'delivered': 1, 'coalesced': 9 })
+
+    def test_zones_are_coalesced_separately(self):
+        queue = ControlQueue()
+        queue.put_lights_state("front", True)
+        queue.put_lights_state("back", True)
+        queue.put_lights_state("front", False)
+        self.assertEqual([queue.get(0), queue.get(0)], [(Event.OFF, "front"), (Event.ON, "back")])
+
+    def test_other_events_keep_their_order(self):
+        queue = ControlQueue()
+        hook = object()
+        queue.put((Event.SET_HOOK, "garden-lights", hook))
+        queue.put_lights_state("garden-lights", True)
+        queue.put((Event.EXIT,))
+        # Replaces the waiting state where it stands, ahead of the EXIT
+        queue.put_lights_state("garden-lights", False)
+        queue.put((Event.SWITCH, True))
+
+        self.assertEqual([queue.get(0) for _ in range(4)], [
+            (Event.SET_HOOK, "garden-lights", hook),
+            (Event.OFF, "garden-lights"),
+            (Event.EXIT,),
+            (Event.SWITCH, True)
+        ])
+        self.assertEqual(queue.stats(), { 'depth': 0, 'delivered': 4, 'coalesced': 1 })
+
+
+class SchedulerTest(unittest.TestCase):
+    def test_runs_due_timers_in_order_and_skips_cancelled(self):
+        scheduler = Scheduler()
+        ran = []
+        scheduler.call_later(0.02, ran.append, "second")
+        scheduler.call_later(0.0, ran.append, "first")
+        cancelled = scheduler.call_later(0.01, ran.append, "cancelled")
+        scheduler.cancel(cancelled)
+
+        scheduler.run_due()
+        self.assertEqual(ran, ["first"])
+        self.assertGreater(scheduler.timeout(), 0.0)
+
+        time.sleep(0.03)
+        scheduler.run_due()
+        self.assertEqual(ran, ["first", "second"])
+        self.assertIsNone(scheduler.timeout())
+
+
+@mock.patch.object(garden_controller, "ON_DELAY", 0.05)
+class GardenControllerTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.state_file = os.path.join(directory.name, "garden-state.json")
+        self.gpio = SimulatedBackend()
+        patcher = mock.patch.object(garden_controller, "_GPIO", self.gpio)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def snapshot(self, lit):
+        with open(self.state_file, "w") as f:
+            json.dump({ "lights": { "garden-lights": lit } }, f)
+
+    def writes(self, since=0):
+        return [(pin, value) for _, pin, value in self.gpio.trace[since:] if pin in PINS]
+
+    def levels(self):
+        return [self.gpio.read(pin) for pin in PINS]
+
+    def wait_for_levels(self, levels):
+        deadline = time.monotonic() + 5
+        while self.levels() != levels:
+            if time.monotonic() > deadline:
+                raise AssertionError(f"pins {self.levels()}, expected {levels}")
+            time.sleep(0.005)
+
+    def test_restore_staggers_pins_which_are_off(self):
+        # The last run failed with the first pin on and the rest still ramping
+        self.gpio.write(14, HIGH)
+        self.snapshot(True)
+        start = len(self.gpio.trace)
+        with GardenController(ZONES, self.state_file):
+            self.wait_for_levels([HIGH] * 4)
+            times = [at for at, pin, value in self.gpio.trace[start:] if pin in PINS]
+        self.assertEqual(self.writes(start)[:3], [(15, HIGH), (24, HIGH), (25, HIGH)])
+        self.assertGreaterEqual(times[2] - times[0], 1.5 * garden_controller.ON_DELAY)
+
+    def test_restore_leaves_lit_pins_alone(self):
+        self.gpio.setup_outputs(PINS, HIGH)
+        self.snapshot(True)
+        start = len(self.gpio.trace)
+        with GardenController(ZONES, self.state_file):
+            time.sleep(garden_controller.ON_DELAY)
+            self.assertEqual(self.writes(start), [])
+
+    def test_failure_leaves_lights_on(self):
+        self.gpio.setup_outputs(PINS, HIGH)
+        self.snapshot(True)
+        with self.assertRaises(TimeoutError):
+            with GardenController(ZONES, self.state_file):
+                raise TimeoutError("connect timed out")
+        self.assertEqual(self.levels(), [HIGH] * 4)
+
+    def test_deliberate_exit_turns_lights_off(self):
+        for interrupt in [None, KeyboardInterrupt]:
+            with self.subTest(interrupt=interrupt):
+                self.gpio.setup_outputs(PINS, HIGH)
+                self.snapshot(True)
+                try:
+                    with GardenController(ZONES, self.state_file):
+                        if interrupt is not None:
+                            raise interrupt()
+                except KeyboardInterrupt:
+                    pass
+                self.assertEqual(self.levels(), [LOW] * 4)
+                # The snapshot is kept for the next start
+                with open(self.state_file) as f:
+                    self.assertEqual(json.load(f), { "lights": { "garden-lights": True } })
+
+    def test_configured_ready_and_switch_pins(self):
+        with GardenController(ZONES, self.state_file, ready_pin=22, switch_pin=27) as controller:
+            self.assertEqual(self.gpio.read(22), HIGH)
+            # The switch is watched once the control thread takes its first event
+            controller.set_update_hook('garden-lights', None)
+            deadline = time.monotonic() + 5
+            while controller.get_queue_stats()['delivered'] == 0:
+                if time.monotonic() > deadline:
+                    raise AssertionError("the control thread didn't start")
+                time.sleep(0.005)
+            self.gpio.set_input(27, LOW)
+            self.wait_for_levels([HIGH, LOW, LOW, LOW])
+        self.assertEqual(self.gpio.read(22), LOW)
+        self.assertNotIn(garden_controller.READY_PIN, [pin for _, pin, _ in self.gpio.trace])
+
+
+    def test_off_cancels_the_rest_of_a_ramp(self):
+        with GardenController(ZONES, self.state_file) as controller:
+            controller.lights_on('garden-lights')
+            self.wait_for_levels([HIGH, LOW, LOW, LOW])
+            controller.lights_off('garden-lights')
+            self.wait_for_levels([LOW] * 4)
+            start = len(self.gpio.trace)
+            time.sleep(4 * garden_controller.ON_DELAY)
+            self.assertEqual(self.writes(start), [])
+
+    def test_burst_applies_only_the_last_state(self):
+        controller = garden_controller.ControlThread(ZONES, self.state_file)
+        hooked = []
+        controller.set_update_hook('garden-lights', hooked.append)
+        # Queued before the thread starts, so the whole burst is waiting at once
+        for i in range(9):
+            controller.set_lights_state('garden-lights', i % 2 == 0)
+        start = len(self.gpio.trace)
+        controller.start()
+        try:
+            self.wait_for_levels([HIGH] * 4)
+        finally:
+            controller.exit()
+
+        self.assertEqual(self.writes(start)[:4], [(pin, HIGH) for pin in PINS])
+        self.assertEqual(hooked, [True])
+        self.assertEqual(controller.get_queue_stats()['coalesced'], 8)
+
+    def test_zones_ramp_at_once(self):
+        zones = {
+            'front': { 'friendly_name': 'Front', 'control-pins': [14, 15] },
+            'back': { 'friendly_name': 'Back', 'control-pins': [24, 25] }
+        }
+        with GardenController(zones, self.state_file) as controller:
+            start = len(self.gpio.trace)
+            controller.lights_on('front')
+            controller.lights_on('back')
+            self.wait_for_levels([HIGH] * 4)
+            times = { pin: at for at, pin, value in self.gpio.trace[start:] if value == HIGH }
+
+        # Each zone staggers its own pins, but neither waits for the other's ramp
+        delay = garden_controller.ON_DELAY
+        self.assertLess(abs(times[24] - times[14]), delay / 2)
+        self.assertGreaterEqual(times[15] - times[14], delay * 0.9)
+        self.assertGreaterEqual(times[25] - times[24], delay * 0.9)
+        self.assertLess(max(times.values()) - min(times.values()), delay * 1.5)
+
+
+if __name__ == "__main__":
+    unittest.main()
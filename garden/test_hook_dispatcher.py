@@ -0,0 +1,118 @@
+import threading
+import time
+import unittest
+
+from hook_dispatcher import DROP_NEWEST, HookDispatcher
+
+
+class Recorder:
+    """
+    Records hook calls, and can hold them until released
+    """
+    def __init__(self):
+        self.calls = []
+        self.running = set()
+        self.overlapped = False
+        self.release = threading.Event()
+        self.release.set()
+        self._lock = threading.Lock()
+
+    def hook(self, name, value):
+        with self._lock:
+            self.overlapped |= name in self.running
+            self.running.add(name)
+        self.release.wait(5)
+        with self._lock:
+            self.running.discard(name)
+            self.calls.append((name, value))
+
+
+class HookDispatcherTest(unittest.TestCase):
+    def setUp(self):
+        self.recorder = Recorder()
+
+    def dispatcher(self, **kwargs):
+        dispatcher = HookDispatcher(**kwargs)
+        self.addCleanup(dispatcher.stop)
+        return dispatcher
+
+    def submit(self, dispatcher, name, value):
+        dispatcher.submit(name, self.recorder.hook, name, value)
+
+    def block(self, dispatcher):
+        # Keep the only worker busy so that later calls wait in the queue
+        self.recorder.release.clear()
+        self.submit(dispatcher, "busy", 0)
+        deadline = time.monotonic() + 5
+        while "busy" not in self.recorder.running:
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.001)
+
+    def test_overflow_replaces_the_same_name(self):
+        dispatcher = self.dispatcher(workers=1, max_pending=2)
+        self.block(dispatcher)
+        self.submit(dispatcher, "front", 1)
+        self.submit(dispatcher, "back", 1)
+        self.submit(dispatcher, "front", 2)
+        self.submit(dispatcher, "front", 3)
+        self.recorder.release.set()
+        dispatcher.stop()
+
+        self.assertEqual(self.recorder.calls, [("busy", 0), ("front", 3), ("back", 1)])
+        stats = dispatcher.stats()
+        self.assertEqual((stats['dropped'], stats['replaced']), (0, 2))
+
+    def test_overflow_keeps_every_name_with_a_call(self):
+        dispatcher = self.dispatcher(workers=1, max_pending=3)
+        self.block(dispatcher)
+        self.submit(dispatcher, "back", 1)
+        # Below the limit, so both front calls wait
+        self.submit(dispatcher, "front", 1)
+        self.submit(dispatcher, "front", 2)
+        # The superseded front call makes room, rather than back's only one
+        self.submit(dispatcher, "side", 1)
+        self.recorder.release.set()
+        dispatcher.stop()
+
+        self.assertEqual(self.recorder.calls, [("busy", 0), ("back", 1), ("front", 2), ("side", 1)])
+        self.assertEqual(dispatcher.stats()['dropped'], 1)
+
+    def test_overflow_policy_when_every_call_is_the_last_of_its_name(self):
+        for overflow, expected in [(None, ["back", "side"]), (DROP_NEWEST, ["front", "back"])]:
+            with self.subTest(overflow=overflow):
+                self.recorder = Recorder()
+                kwargs = {} if overflow is None else { "overflow": overflow }
+                dispatcher = self.dispatcher(workers=1, max_pending=2, **kwargs)
+                self.block(dispatcher)
+                for name in ["front", "back", "side"]:
+                    self.submit(dispatcher, name, 1)
+                self.recorder.release.set()
+                dispatcher.stop()
+                self.assertEqual([name for name, _ in self.recorder.calls[1:]], expected)
+                self.assertEqual(dispatcher.stats()['dropped'], 1)
+
+    def test_same_name_runs_one_at_a_time_in_order(self):
+        dispatcher = self.dispatcher(workers=4, max_pending=64)
+        for value in range(20):
+            self.submit(dispatcher, "front", value)
+            self.submit(dispatcher, "back", value)
+        dispatcher.stop()
+
+        self.assertFalse(self.recorder.overlapped)
+        for name in ["front", "back"]:
+            self.assertEqual([value for n, value in self.recorder.calls if n == name], list(range(20)))
+
+    def test_stop_drains_the_queue(self):
+        dispatcher = self.dispatcher(workers=1)
+        self.block(dispatcher)
+        for value in range(5):
+            self.submit(dispatcher, f"zone-{value}", value)
+        self.recorder.release.set()
+        dispatcher.stop()
+
+        self.assertEqual(len(self.recorder.calls), 6)
+        self.assertEqual(dispatcher.stats()['pending'], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
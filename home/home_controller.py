@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+"""
+One listener for every device wired to a Pi. The devices are listed in a JSON
+manifest, and all their shadows share a single MQTT connection, rather than
+each controller running its own listener process with its own connection.
+"""
+from contextlib import ExitStack
+from garden_devices import GardenDevices
+from iot_client import IoTClient
+from window_devices import WindowDevices
+import flight_recorder
+import json
+import local_api
+import logger
+import os
+import pushover
+import signal
+import sys
+import time
+
+
+_MANIFEST = os.environ.get("DEVICE_MANIFEST", "devices.json")
+_CLIENT_ID = "home-controller"
+_STATS_PORT = 8080
+_LOCAL_API_PORT = 8090
+
+_LOG = logger.create("home_controller", logger.INFO)
+
+
+_DEVICE_TYPES = {
+    "garden": GardenDevices,
+    "windows": WindowDevices
+}
+
+
+def create_devices(iot, manifest):
+    return [_DEVICE_TYPES[device["type"]](iot, device) for device in manifest["devices"]]
+
+
+if __name__ == "__main__":
+    # Stop cleanly for systemd as for Ctrl-C
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    started = time.monotonic()
+    with open(sys.argv[1] if len(sys.argv) > 1 else _MANIFEST) as f:
+        manifest = json.load(f)
+    client_id = manifest.get("client_id", _CLIENT_ID)
+
+    iot = IoTClient(client_id)
+    devices = create_devices(iot, manifest)
+    flight_recorder.serve(manifest.get("stats_port", _STATS_PORT), lambda: {
+        'iot': iot.stats(),
+        'pushover': pushover.stats(),
+        'devices': { device.name: device.stats() for device in devices }
+    })
+
+    with ExitStack() as stack:
+        # Disconnect last, once the devices have stopped reporting
+        stack.callback(iot.disconnect)
+        for device in devices:
+            stack.enter_context(device)
+        iot.connect()
+        for device in devices:
+            device.listen()
+        local_api.serve(manifest.get("local_api_port", _LOCAL_API_PORT), iot.shadows)
+        _LOG.info(f"ready for commands in {(time.monotonic() - started) * 1000:.0f}ms")
+
+        pushover.send(client_id, "Listener started")
+
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
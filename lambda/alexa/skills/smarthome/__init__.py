@@ -12,4 +12,5 @@
 # language governing permissions and limitations under the License.
 
 from .alexa_response import AlexaResponse
-from .alexa_utils import get_utc_timestamp
+from .alexa_response_builder import AlexaResponseBuilder
+from .alexa_utils import get_message_id, get_utc_timestamp
@@ -11,10 +11,7 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific
 # language governing permissions and limitations under the License.
 
-import random
-import uuid
-
-from .alexa_utils import get_utc_timestamp
+from .alexa_utils import get_message_id, get_utc_timestamp
 
 
 class AlexaResponse:
@@ -30,7 +27,7 @@ class AlexaResponse:
             'header': {
                 'namespace': kwargs.get('namespace', 'Alexa'),
                 'name': kwargs.get('name', 'Response'),
-                'messageId': str(uuid.uuid4()),
+                'messageId': get_message_id(),
                 'payloadVersion': kwargs.get('payload_version', '3')
                 # 'correlation_token': kwargs.get('correlation_token', 'INVALID')
             },
@@ -77,12 +74,17 @@ class AlexaResponse:
         }
 
     def create_payload_endpoint(self, **kwargs):
+        if 'endpoint_id' not in kwargs:
+            # Only needed for the sample id, so keep it off the import path
+            import random
+            kwargs['endpoint_id'] = 'endpoint_' + "%0.6d" % random.randint(0, 999999)
+
         # Return the proper structure expected for the endpoint
         endpoint = {
             'capabilities': kwargs.get('capabilities', []),
             'description': kwargs.get('description', 'Sample Endpoint Description'),
             'displayCategories': kwargs.get('display_categories', ['OTHER']),
-            'endpointId': kwargs.get('endpoint_id', 'endpoint_' + "%0.6d" % random.randint(0, 999999)),
+            'endpointId': kwargs['endpoint_id'],
             'friendlyName': kwargs.get('friendly_name', 'Sample Endpoint'),
             'manufacturerName': kwargs.get('manufacturer_name', 'Sample Manufacturer')
         }
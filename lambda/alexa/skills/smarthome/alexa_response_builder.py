@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Amazon Software License (the "License"). You may not use this file except in
+# compliance with the License. A copy of the License is located at
+#
+#    http://aws.amazon.com/asl/
+#
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+
+from .alexa_utils import get_message_id, get_utc_timestamp
+
+
+# Responses which carry no endpoint, as in AlexaResponse
+_NO_ENDPOINT = frozenset(['AcceptGrant.Response', 'Discover.Response'])
+
+# Prebuilt parts shared by every response which uses the defaults
+_DEFAULT_ENDPOINT = {
+    'scope': {
+        'type': 'BearerToken',
+        'token': 'INVALID'
+    },
+    'endpointId': 'INVALID'
+}
+_CONNECTIVITY_OK = {'value': 'OK'}
+
+
+class AlexaResponseBuilder:
+    """
+    A lighter equivalent of AlexaResponse for the responses built on every
+    request. get() produces the same structure as AlexaResponse.get(), but
+    the builder only holds what it needs, builds the nested dicts once and
+    shares the default parts between responses, so treat the result as
+    read-only.
+    """
+
+    __slots__ = ['_header', '_endpoint', '_payload', '_properties']
+
+    def __init__(self, namespace='Alexa', name='Response', payload_version='3', correlation_token=None,
+                 token='INVALID', endpoint_id='INVALID', cookie=None, payload=None):
+        self._header = {
+            'namespace': namespace,
+            'name': name,
+            'messageId': get_message_id(),
+            'payloadVersion': payload_version
+        }
+        if correlation_token is not None:
+            self._header['correlation_token'] = correlation_token
+
+        if name in _NO_ENDPOINT:
+            self._endpoint = None
+        elif token == 'INVALID' and endpoint_id == 'INVALID' and cookie is None:
+            self._endpoint = _DEFAULT_ENDPOINT
+        else:
+            self._endpoint = {
+                'scope': {
+                    'type': 'BearerToken',
+                    'token': token
+                },
+                'endpointId': endpoint_id
+            }
+            if cookie is not None:
+                self._endpoint['cookie'] = cookie
+
+        self._payload = {} if payload is None else payload
+        self._properties = None
+
+    def add_context_property(self, namespace='Alexa.EndpointHealth', name='connectivity', value=None,
+                             uncertainty_in_milliseconds=0):
+        prop = {
+            'namespace': namespace,
+            'name': name,
+            'value': _CONNECTIVITY_OK if value is None else value,
+            'timeOfSample': get_utc_timestamp(),
+            'uncertaintyInMilliseconds': uncertainty_in_milliseconds
+        }
+        if self._properties is None:
+            self._properties = [prop]
+        else:
+            self._properties.append(prop)
+
+    def get(self):
+        if self._endpoint is None:
+            event = {'header': self._header, 'payload': self._payload}
+        else:
+            event = {'header': self._header, 'endpoint': self._endpoint, 'payload': self._payload}
+
+        if self._properties is None:
+            return {'event': event}
+        return {'context': {'properties': self._properties}, 'event': event}
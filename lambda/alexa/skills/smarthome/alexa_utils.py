@@ -11,10 +11,33 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific
 # language governing permissions and limitations under the License.
 
+import os
 import time
 
 
+_current_timestamp = (None, None)
+
+
 def get_utc_timestamp(seconds=None):
-    return time.strftime('%Y-%m-%dT%H:%M:%S.00Z', time.gmtime(seconds))
+    if seconds is not None:
+        return time.strftime('%Y-%m-%dT%H:%M:%S.00Z', time.gmtime(seconds))
+
+    # The format only has whole seconds, so reuse the string within a second
+    global _current_timestamp
+    now = int(time.time())
+    second, timestamp = _current_timestamp
+    if second != now:
+        timestamp = time.strftime('%Y-%m-%dT%H:%M:%S.00Z', time.gmtime(now))
+        _current_timestamp = (now, timestamp)
+    return timestamp
+
+
+# Maps the first hex digit of the variant field onto 8, 9, a or b
+_VARIANT = dict(zip('0123456789abcdef', '89ab' * 4))
 
 
+def get_message_id():
+    # Equivalent to str(uuid.uuid4()) without importing uuid, which drags
+    # platform and friends onto the cold start path
+    h = os.urandom(16).hex()
+    return f'{h[:8]}-{h[8:12]}-4{h[13:16]}-{_VARIANT[h[16]]}{h[17:20]}-{h[20:]}'
@@ -0,0 +1,4 @@
+"""
+Offline benchmarks for the Lambda handler. Run from the lambda directory,
+e.g. python3 -m bench.confirm_latency
+"""
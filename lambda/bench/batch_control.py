@@ -0,0 +1,67 @@
+"""
+Time set_device_states against the fake iot-data backend: a batch of slow
+devices should take about as long as the slowest of them, not the sum, and a
+device whose update raises should fail alone.
+"""
+import argparse
+import time
+
+import lambda_function
+from .fake_iot import FakeIoTData
+
+
+class FailingIoTData(FakeIoTData):
+    """
+    Raises for the things named, as boto3 would for a throttled or missing thing
+    """
+    def __init__(self, failing, **kwargs):
+        super().__init__(**kwargs)
+        self._failing = failing
+
+    def update_thing_shadow(self, thingName, payload):
+        if thingName in self._failing:
+            raise RuntimeError(f'update failed for {thingName}')
+        return super().update_thing_shadow(thingName=thingName, payload=payload)
+
+
+def timed(func, *args):
+    start = time.monotonic()
+    result = func(*args)
+    return result, time.monotonic() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--devices', type=int, default=6)
+    parser.add_argument('--step', type=float, default=0.1,
+                        help='each device confirms this much later than the one before')
+    args = parser.parse_args()
+
+    delays = {f'device-{i}': (i + 1) * args.step for i in range(args.devices)}
+    states = {endpoint_id: 'ON' for endpoint_id in delays}
+    lambda_function.emit_metrics = False
+
+    lambda_function._aws_iot = FakeIoTData(delay=delays.get)
+    _, sequential = timed(lambda: {e: lambda_function.set_device_state(e, v) for e, v in states.items()})
+
+    lambda_function._aws_iot = FakeIoTData(delay=delays.get)
+    results, batched = timed(lambda_function.set_device_states, states)
+
+    slowest = max(delays.values())
+    print(f'{args.devices} devices, slowest confirms after {slowest * 1000:.0f}ms')
+    print(f'  one at a time   {sequential * 1000:8.0f}ms')
+    print(f'  set_device_states {batched * 1000:6.0f}ms  {results}')
+
+    failing = {'device-0'}
+    lambda_function._aws_iot = FailingIoTData(failing, delay=delays.get)
+    partial, _ = timed(lambda_function.set_device_states, states)
+    print(f'  with {sorted(failing)} raising: {partial}')
+
+    # The batch should cost about the slowest device, plus polling granularity
+    expected = {e: (None if e in failing else True) for e in states}
+    if any(r is not True for r in results.values()) or partial != expected or batched > slowest + 0.6:
+        raise SystemExit('set_device_states did not behave as expected')
+
+
+if __name__ == '__main__':
+    main()
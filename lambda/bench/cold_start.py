@@ -0,0 +1,83 @@
+"""
+Cold start budget check. Imports lambda_function in a fresh interpreter under
+python -X importtime, handles one Discover directive, and fails if import plus
+first handler time exceeds the budget or if boto3 was loaded to answer it.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+
+# Generous enough for a 128MB Lambda; tighten as the import graph shrinks
+DEFAULT_BUDGET_MS = 60.0
+
+_CHILD = """
+import json, sys, time
+start = time.perf_counter()
+import lambda_function
+imported = time.perf_counter()
+lambda_function.lambda_handler({
+    'directive': {
+        'header': {'namespace': 'Alexa.Discovery', 'name': 'Discover', 'payloadVersion': '3', 'messageId': 'cold'},
+        'payload': {}
+    }
+}, None)
+handled = time.perf_counter()
+print(json.dumps({
+    'import_ms': (imported - start) * 1000,
+    'handler_ms': (handled - imported) * 1000,
+    'boto3_loaded': 'boto3' in sys.modules
+}))
+"""
+
+
+def parse_importtime(stderr):
+    """
+    Map each module to its (self, cumulative) import time in milliseconds
+    """
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        modules[name.strip()] = (int(self_us) / 1000, int(cumulative_us) / 1000)
+    return modules
+
+
+def measure():
+    lambda_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    child = subprocess.run([sys.executable, '-X', 'importtime', '-c', _CHILD],
+                           cwd=lambda_dir, capture_output=True, text=True, check=True)
+    return json.loads(child.stdout.splitlines()[-1]), parse_importtime(child.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--budget-ms', type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument('--runs', type=int, default=5,
+                        help='take the best of this many fresh interpreters')
+    parser.add_argument('--top', type=int, default=10)
+    args = parser.parse_args()
+
+    runs = [measure() for _ in range(args.runs)]
+    timings, modules = min(runs, key=lambda run: run[0]['import_ms'] + run[0]['handler_ms'])
+    total = timings['import_ms'] + timings['handler_ms']
+
+    print(f"import {timings['import_ms']:.1f}ms + first Discover {timings['handler_ms']:.1f}ms "
+          f"= {total:.1f}ms (budget {args.budget_ms:.1f}ms)")
+    print('slowest imports by self time:')
+    for name, (self_ms, cumulative_ms) in sorted(modules.items(), key=lambda m: -m[1][0])[:args.top]:
+        print(f'  {self_ms:7.2f}ms self {cumulative_ms:7.2f}ms cumulative  {name}')
+
+    if timings['boto3_loaded']:
+        print('FAIL: boto3 was imported to answer Discover')
+        sys.exit(1)
+    if total > args.budget_ms:
+        print('FAIL: cold start over budget')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""
+Measure command confirmation latency against the fake iot-data backend:
+the original fixed 250ms polling loop, PollingSource, and event-driven
+confirmation.
+"""
+import argparse
+import json
+import random
+import time
+
+from confirmation import Confirmation, PollingSource, ReportedStateEvents
+from .fake_iot import FakeIoTData
+from .stats import format_summary, summary
+
+
+def fixed_interval_wait(client, thing_name, value, timeout=5.0):
+    """
+    The confirmation loop set_device_state used originally
+    """
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        time.sleep(0.25)
+        try:
+            shadow = json.load(client.get_thing_shadow(thingName=thing_name)['payload'])
+            if shadow['state']['reported']['state'] == value:
+                return True
+        except Exception:
+            pass
+    return False
+
+
+def run(strategy, commands, mean_delay):
+    rng = random.Random(42)
+    events = ReportedStateEvents()
+    client = FakeIoTData(delay=lambda thing: rng.expovariate(1.0 / mean_delay),
+                         events=events if strategy == 'events' else None)
+    if strategy == 'events':
+        events.subscribe('bench')
+    engine = Confirmation(events, PollingSource(lambda: client))
+
+    samples = []
+    for i in range(commands):
+        value = 'ON' if i % 2 == 0 else 'OFF'
+        start = time.monotonic()
+        response = client.update_thing_shadow(
+            thingName='bench',
+            payload=json.dumps({'state': {'desired': {'state': value}}}))
+        if strategy == 'fixed':
+            fixed_interval_wait(client, 'bench', value)
+        else:
+            engine.wait('bench', value, json.load(response['payload'])['version'])
+        samples.append(time.monotonic() - start)
+    return samples, client.calls['get_thing_shadow']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--commands', type=int, default=40)
+    parser.add_argument('--mean-delay', type=float, default=0.1,
+                        help='mean device confirmation delay in seconds')
+    parser.add_argument('--slack', type=float, default=10.0,
+                        help='milliseconds PollingSource may trail the fixed loop by, for timer jitter')
+    args = parser.parse_args()
+
+    results = {}
+    for strategy in ['fixed', 'polling', 'events']:
+        samples, reads = run(strategy, args.commands, args.mean_delay)
+        results[strategy] = summary(samples)
+        print(f'{format_summary(strategy, samples)} get_thing_shadow={reads}')
+
+    # Polling is what runs in production, so it must never confirm later than the loop it replaced
+    worse = [p for p in ['p50', 'p95', 'p99']
+             if results['polling'][p] > results['fixed'][p] + args.slack]
+    if worse:
+        raise SystemExit(f'PollingSource is slower than the fixed loop at {", ".join(worse)}')
+
+
+if __name__ == '__main__':
+    main()
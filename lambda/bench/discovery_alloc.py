@@ -0,0 +1,71 @@
+"""
+Compare the cost of answering Discover with the precomputed template against
+rebuilding the response with AlexaResponse on every call.
+"""
+import argparse
+import json
+import sys
+import timeit
+import tracemalloc
+
+import lambda_function
+
+
+_REQUEST = {
+    'directive': {
+        'header': {
+            'namespace': 'Alexa.Discovery',
+            'name': 'Discover',
+            'payloadVersion': '3',
+            'messageId': 'bench'
+        },
+        'payload': {}
+    }
+}
+
+
+def rebuild():
+    """
+    The original path, which also serialised the response for the debug log
+    """
+    response = lambda_function.build_discovery_response()
+    json.dumps(response)
+    return response
+
+
+def template():
+    return lambda_function.discover_devices(_REQUEST)
+
+
+def allocations(func, calls=200):
+    """
+    Blocks and traced bytes kept alive per call
+    """
+    results = []
+    func()
+    tracemalloc.start()
+    blocks = sys.getallocatedblocks()
+    for _ in range(calls):
+        results.append(func())
+    retained = (sys.getallocatedblocks() - blocks) / calls
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return retained, peak / calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--calls', type=int, default=10000)
+    args = parser.parse_args()
+
+    assert json.loads(json.dumps(template()))['event']['payload'] == \
+        json.loads(json.dumps(rebuild()))['event']['payload']
+
+    for label, func in [('rebuild', rebuild), ('template', template)]:
+        seconds = timeit.timeit(func, number=args.calls) / args.calls
+        retained, peak = allocations(func)
+        print(f'{label:<10} {seconds * 1e6:8.2f}us/call  {retained:7.1f} blocks/call  {peak:9.0f} bytes/call')
+
+
+if __name__ == '__main__':
+    main()
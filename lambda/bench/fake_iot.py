@@ -0,0 +1,68 @@
+import io
+import json
+import threading
+
+
+class ResourceNotFoundException(Exception):
+    pass
+
+
+class FakeIoTData:
+    """
+    In-process stand-in for the boto3 'iot-data' client. Each thing has a
+    simulated device which copies the latest desired state to reported state
+    after a delay, as the Raspberry Pi listeners do. A delay of None means the
+    device is offline and never reports.
+    """
+    exceptions = type('exceptions', (), {'ResourceNotFoundException': ResourceNotFoundException})
+
+    def __init__(self, delay=0.1, events=None):
+        self._delay = delay
+        self._events = events
+        self._lock = threading.Lock()
+        self._shadows = {}
+        self.calls = {'update_thing_shadow': 0, 'get_thing_shadow': 0}
+
+    def _device_delay(self, thing_name):
+        return self._delay(thing_name) if callable(self._delay) else self._delay
+
+    def _document(self, thing_name):
+        return self._shadows.setdefault(thing_name, {'state': {}, 'version': 0})
+
+    @staticmethod
+    def _response(document):
+        return {'payload': io.BytesIO(json.dumps(document).encode('utf-8'))}
+
+    def update_thing_shadow(self, thingName, payload):
+        state = json.loads(payload)['state']
+        with self._lock:
+            self.calls['update_thing_shadow'] += 1
+            document = self._document(thingName)
+            for section, values in state.items():
+                document['state'].setdefault(section, {}).update(values)
+            document['version'] += 1
+            accepted = {'state': state, 'version': document['version']}
+
+        delay = self._device_delay(thingName)
+        if delay is not None and 'desired' in state:
+            timer = threading.Timer(delay, self._report, (thingName,))
+            timer.daemon = True
+            timer.start()
+        return self._response(accepted)
+
+    def get_thing_shadow(self, thingName):
+        with self._lock:
+            self.calls['get_thing_shadow'] += 1
+            if thingName not in self._shadows:
+                raise ResourceNotFoundException(thingName)
+            return self._response(self._shadows[thingName])
+
+    def _report(self, thing_name):
+        with self._lock:
+            document = self._document(thing_name)
+            reported = dict(document['state'].get('desired', {}))
+            document['state'].setdefault('reported', {}).update(reported)
+            document['version'] += 1
+            accepted = {'state': {'reported': reported}, 'version': document['version']}
+        if self._events is not None:
+            self._events.notify_document(thing_name, accepted)
@@ -0,0 +1,103 @@
+"""
+Replay a JSONL corpus of Alexa directives through lambda_handler against the
+fake iot-data backend, and report throughput and latency per directive type.
+"""
+import argparse
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+
+import lambda_function
+from .fake_iot import FakeIoTData
+from .stats import format_summary
+
+
+_DEFAULT_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'directives.jsonl')
+
+
+def load_corpus(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def device_delays(mean_delay, offline, seed=42):
+    """
+    Exponentially distributed confirmation delays, with some things offline
+    """
+    rng = random.Random(seed)
+    lock = threading.Lock()
+
+    def delay(thing_name):
+        if thing_name in offline:
+            return None
+        with lock:
+            return rng.expovariate(1.0 / mean_delay)
+    return delay
+
+
+def endpoint_id(request):
+    try:
+        return request['directive']['endpoint']['endpointId']
+    except (KeyError, TypeError):
+        return None
+
+
+def replay(corpus, concurrency, repeat):
+    samples = {}
+    errors = {}
+    lock = threading.Lock()
+
+    # Commands to one device don't overlap, as they wouldn't from a real user;
+    # otherwise a TurnOn and TurnOff racing each other would time out
+    endpoint_locks = {endpoint_id(request): threading.Lock() for request in corpus}
+
+    def invoke(request):
+        label = lambda_function.directive_name(request)
+        with endpoint_locks[endpoint_id(request)] if endpoint_id(request) else nullcontext():
+            start = time.perf_counter()
+            try:
+                response = lambda_function.lambda_handler(request, None)
+                failed = response is None or response['event']['header']['name'] == 'ErrorResponse'
+            except Exception:
+                failed = True
+            elapsed = time.perf_counter() - start
+        with lock:
+            samples.setdefault(label, []).append(elapsed)
+            errors[label] = errors.get(label, 0) + (1 if failed else 0)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _ in range(repeat):
+            for request in corpus:
+                pool.submit(invoke, request)
+    return samples, errors, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--corpus', default=_DEFAULT_CORPUS)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--mean-delay', type=float, default=0.1,
+                        help='mean device confirmation delay in seconds')
+    parser.add_argument('--offline', action='append', default=[], metavar='THING',
+                        help='thing which never confirms; may be repeated')
+    args = parser.parse_args()
+
+    lambda_function.emit_metrics = False
+    lambda_function._aws_iot = FakeIoTData(delay=device_delays(args.mean_delay, set(args.offline)))
+    samples, errors, elapsed = replay(load_corpus(args.corpus), args.concurrency, args.repeat)
+
+    total = sum(len(s) for s in samples.values())
+    print(f'{total} directives in {elapsed:.2f}s = {total / elapsed:.1f}/s at concurrency {args.concurrency}')
+    for label in sorted(samples):
+        print(f'{format_summary(label, samples[label])} errors={errors[label]}')
+    print(f'iot-data calls: {lambda_function._aws_iot.calls}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""
+Compare building a PowerController response with AlexaResponse and with
+AlexaResponseBuilder.
+"""
+import argparse
+import sys
+import timeit
+import tracemalloc
+
+from alexa.skills.smarthome import AlexaResponse, AlexaResponseBuilder
+
+
+def original():
+    apcr = AlexaResponse(correlation_token='bench-token')
+    apcr.add_context_property(namespace='Alexa.PowerController', name='powerState', value='ON')
+    return apcr.get()
+
+
+def builder():
+    apcr = AlexaResponseBuilder(correlation_token='bench-token')
+    apcr.add_context_property(namespace='Alexa.PowerController', name='powerState', value='ON')
+    return apcr.get()
+
+
+def without_message_id(response):
+    response['event']['header'].pop('messageId')
+    return response
+
+
+def allocations(func, calls=200):
+    """
+    Blocks kept alive by each response, and the peak traced bytes while
+    building one, which includes temporaries such as kwargs dicts
+    """
+    func()
+    blocks = sys.getallocatedblocks()
+    kept = [func() for _ in range(calls)]
+    retained = (sys.getallocatedblocks() - blocks) / calls
+    del kept
+
+    tracemalloc.start()
+    peaks = []
+    for _ in range(calls):
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        func()
+        peaks.append(tracemalloc.get_traced_memory()[1] - current)
+    tracemalloc.stop()
+    return retained, sum(peaks) / calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--calls', type=int, default=20000)
+    args = parser.parse_args()
+
+    assert without_message_id(original()) == without_message_id(builder())
+
+    for label, func in [('AlexaResponse', original), ('Builder', builder)]:
+        seconds = timeit.timeit(func, number=args.calls) / args.calls
+        retained, peak = allocations(func)
+        print(f'{label:<14} {seconds * 1e6:6.2f}us/call  {retained:5.1f} blocks/call  {peak:6.0f} peak bytes/call')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,26 @@
+def percentile(samples, p):
+    """
+    Nearest-rank percentile of a list of samples
+    """
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(0, min(len(ordered) - 1, int(round(p / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+def summary(samples):
+    """
+    p50/p95/p99 in milliseconds for a list of durations in seconds
+    """
+    return {
+        'count': len(samples),
+        'p50': percentile(samples, 50) * 1000,
+        'p95': percentile(samples, 95) * 1000,
+        'p99': percentile(samples, 99) * 1000
+    }
+
+
+def format_summary(label, samples):
+    s = summary(samples)
+    return f"{label:<32} n={s['count']:<5} p50={s['p50']:8.1f}ms p95={s['p95']:8.1f}ms p99={s['p99']:8.1f}ms"
@@ -0,0 +1,131 @@
+import json
+import threading
+import time
+
+from metrics import NULL_METRICS
+
+
+def _read_payload(response):
+    """
+    Decode the JSON document in an iot-data response
+    """
+    return json.loads(response['payload'].read())
+
+
+def _reported_state(shadow):
+    """
+    Extract the reported device state from a shadow document
+    """
+    return shadow.get('state', {}).get('reported', {}).get('state')
+
+
+class ReportedStateEvents:
+    """
+    Push source of reported state changes. Something subscribed to the shadow
+    'update/accepted' or 'update/documents' topics calls notify() for every
+    accepted update, and waiters are woken as soon as their state arrives.
+    """
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._things = {}
+
+    def subscribe(self, thing_name):
+        with self._condition:
+            self._things.setdefault(thing_name, (None, 0))
+
+    def notify(self, thing_name, state, version):
+        with self._condition:
+            if thing_name in self._things and version > self._things[thing_name][1]:
+                self._things[thing_name] = (state, version)
+                self._condition.notify_all()
+
+    def notify_document(self, thing_name, document):
+        """
+        Feed a raw shadow document, as published on update/accepted
+        """
+        state = _reported_state(document)
+        if state is not None:
+            self.notify(thing_name, state, document.get('version', 0))
+
+    def wait(self, thing_name, value, version, deadline, metrics=NULL_METRICS):
+        """
+        Wait until the thing reports the value at a later version than the
+        update which requested it. Returns the confirming version, False on
+        timeout, or None when this source isn't watching the thing.
+        """
+        with self._condition:
+            if thing_name not in self._things:
+                return None
+
+            def confirmed():
+                state, seen = self._things[thing_name]
+                return state == value and seen > version
+
+            while not confirmed():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+            return self._things[thing_name][1]
+
+
+class PollingSource:
+    """
+    Fallback source which reads the shadow with get_thing_shadow: once after
+    first_delay, by when a quick device has usually reported, and then every
+    interval from the update. Those are the reads the original fixed 250ms
+    loop made, so confirmation is never later than it was, and the early
+    read confirms quick devices sooner.
+    """
+    def __init__(self, get_client, first_delay=0.2, interval=0.25):
+        self._get_client = get_client
+        self._first_delay = first_delay
+        self._interval = interval
+
+    def wait(self, thing_name, value, version, deadline, metrics=NULL_METRICS):
+        start = time.monotonic()
+        read_at = self._first_delay
+        tick = int(self._first_delay // self._interval) + 1
+        while True:
+            # Sleep before every read, the first included: straight after the
+            # update the device can't have reported yet, and reads are billed
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            time.sleep(max(0.0, min(start + read_at - time.monotonic(), remaining)))
+            read_at = tick * self._interval
+            tick += 1
+
+            try:
+                metrics.count('Polls')
+                with metrics.phase('PollTime'):
+                    shadow = _read_payload(self._get_client().get_thing_shadow(thingName=thing_name))
+                if _reported_state(shadow) == value:
+                    return shadow.get('version', version + 1)
+            except Exception:
+                pass
+
+
+class Confirmation:
+    """
+    Wait for a device to report a desired state, trying each source in turn
+    until one of them is able to answer
+    """
+    def __init__(self, *sources):
+        self._sources = sources
+
+    def wait(self, thing_name, value, version, timeout=5.0, deadline=None, metrics=NULL_METRICS):
+        """
+        Returns the shadow version which confirmed the change, or None if the
+        device did not report the value before the timeout. A monotonic
+        deadline can be given instead, to share one across several waits.
+        """
+        if deadline is None:
+            deadline = time.monotonic() + timeout
+        with metrics.phase('ConfirmationWaitTime'):
+            for source in self._sources:
+                result = source.wait(thing_name, value, version, deadline, metrics)
+                if result is None:
+                    continue
+                return result or None
+            return None
@@ -1,14 +1,49 @@
 
-import boto3
 import json
-import time
 import logging
-from alexa.skills.smarthome import AlexaResponse
+import os
+import threading
+import time
+from alexa.skills.smarthome import AlexaResponse, AlexaResponseBuilder, get_message_id
+from confirmation import Confirmation, PollingSource
+from metrics import InvocationMetrics, NULL_METRICS
+from shadow_cache import ShadowCache
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-aws_iot = boto3.client('iot-data')
+# One Embedded Metric Format record is written to stdout for each invocation
+emit_metrics = os.environ.get('EMIT_METRICS', '1') != '0'
+
+_aws_iot = None
+_aws_iot_lock = threading.Lock()
+
+
+def iot_client():
+    """
+    The iot-data client, created on first use. Loading boto3 and the botocore
+    service model is the bulk of our cold start, and Discovery never needs it.
+    """
+    global _aws_iot
+    if _aws_iot is None:
+        with _aws_iot_lock:
+            if _aws_iot is None:
+                import boto3
+                _aws_iot = boto3.client('iot-data')
+    return _aws_iot
+
+
+# Nothing subscribes to the shadow update topics from the Lambda, so changes are
+# confirmed by reading the shadow. A ReportedStateEvents fed from such a
+# subscription could go ahead of the polling source.
+confirmation = Confirmation(PollingSource(iot_client))
+
+# Lives across warm invocations so the Alexa app refreshing doesn't read the shadow every time
+shadow_cache = ShadowCache()
+
+# How long to wait for devices to confirm a change, and how many to update at once
+_CONFIRMATION_TIMEOUT = 5.0
+_MAX_CONCURRENT_UPDATES = 8
 
 
 _DEVICES = [
@@ -30,12 +65,26 @@ _DEVICES = [
 ]
 
 
+class _LazyJson:
+    """
+    Defers serialising an object for a log message until the message is
+    actually emitted
+    """
+    __slots__ = ['obj']
+
+    def __init__(self, obj):
+        self.obj = obj
+
+    def __str__(self):
+        return json.dumps(self.obj)
+
+
 def error(**kwargs):
     """
     Build an error response
     """
-    rsp = AlexaResponse(name='ErrorResponse', payload=kwargs).get()
-    logger.debug(f'lambda handler failed; response: {json.dumps(rsp)}')
+    rsp = AlexaResponseBuilder(name='ErrorResponse', payload=kwargs).get()
+    logger.debug('lambda handler failed; response: %s', _LazyJson(rsp))
     return rsp
 
 
@@ -43,30 +92,61 @@ def success(obj):
     """
     Log a successful response object
     """
-    logger.debug(f'lambda handler success; response: {json.dumps(obj)}')
+    logger.debug('lambda handler success; response: %s', _LazyJson(obj))
     return obj
 
 
-def discover_devices(request):
+def _freeze(obj):
+    """
+    Make a JSON structure immutable as far as possible while keeping it
+    serialisable: lists become tuples, recursively
+    """
+    if isinstance(obj, dict):
+        return {key: _freeze(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return tuple(_freeze(value) for value in obj)
+    return obj
+
+
+def build_discovery_response():
+    """
+    Build the full Discover.Response for the declared devices
+    """
+    adr = AlexaResponse(namespace='Alexa.Discovery', name='Discover.Response')
+    capability_alexa = adr.create_payload_endpoint_capability()
+    capability_alexa_powercontroller = adr.create_payload_endpoint_capability(
+        interface='Alexa.PowerController',
+        supported=[{'name': 'powerState'}],
+        retrievable=True)
+    for device in _DEVICES:
+        adr.add_payload_endpoint(
+            capabilities=[capability_alexa, capability_alexa_powercontroller],
+            **device
+        )
+    return adr.get()
+
+
+# The discovery payload never changes between invocations, so build it once
+# at cold start and only stamp a fresh messageId into each response
+_DISCOVERY_TEMPLATE = _freeze(build_discovery_response()['event'])
+
+
+def discover_devices(request, metrics=NULL_METRICS):
     """
     Discover the declared devices this handler supports
     """
     command = request['directive']['header']['name']
     if command == 'Discover':
-        adr = AlexaResponse(namespace='Alexa.Discovery', name='Discover.Response')
-        capability_alexa = adr.create_payload_endpoint_capability()
-        capability_alexa_powercontroller = adr.create_payload_endpoint_capability(
-            interface='Alexa.PowerController',
-            supported=[{'name': 'powerState'}])
-        for device in _DEVICES:               
-            adr.add_payload_endpoint(
-                capabilities=[capability_alexa, capability_alexa_powercontroller],
-                **device
-            )
-        return success(adr.get())
+        header = dict(_DISCOVERY_TEMPLATE['header'], messageId=get_message_id())
+        return success({
+            'event': {
+                'header': header,
+                'payload': _DISCOVERY_TEMPLATE['payload']
+            }
+        })
 
 
-def control_device(request):
+def control_device(request, metrics=NULL_METRICS):
     """
     Control a specific device
     """
@@ -75,49 +155,125 @@ def control_device(request):
     correlation_token = request['directive']['header']['correlationToken']
 
     # Check for an error when setting the state
-    state_set = set_device_state(endpoint_id=endpoint_id, value=power_state_value)
+    state_set = set_device_state(endpoint_id=endpoint_id, value=power_state_value, metrics=metrics)
     if state_set is None:
         return error(type='ENDPOINT_UNREACHABLE', message='Unable to reach endpoint database.')
     elif not state_set:
         return error(type='ENDPOINT_UNREACHABLE', message='I did not get a response from the device controller.')
 
-    apcr = AlexaResponse(correlation_token=correlation_token)
+    apcr = AlexaResponseBuilder(correlation_token=correlation_token)
     apcr.add_context_property(namespace='Alexa.PowerController', name='powerState', value=power_state_value)
     return success(apcr.get())
 
 
-def set_device_state(endpoint_id, value):
+def report_state(request, metrics=NULL_METRICS):
+    """
+    Report the current state of a specific device
+    """
+    command = request['directive']['header']['name']
+    if command == 'ReportState':
+        endpoint_id = request['directive']['endpoint']['endpointId']
+        correlation_token = request['directive']['header']['correlationToken']
+
+        value = get_device_state(endpoint_id)
+        if value is None:
+            return error(type='ENDPOINT_UNREACHABLE', message='Unable to read the device state.')
+
+        arsr = AlexaResponseBuilder(name='StateReport', endpoint_id=endpoint_id, correlation_token=correlation_token)
+        arsr.add_context_property(namespace='Alexa.PowerController', name='powerState', value=value)
+        arsr.add_context_property()
+        return success(arsr.get())
+
+
+def get_device_state(endpoint_id):
+    """
+    Get the reported state for a device, from the cache if we have it recently
+    """
+    value = shadow_cache.get(endpoint_id)
+    if value is not None:
+        return value
+
+    try:
+        shadow = json.load(iot_client().get_thing_shadow(thingName=endpoint_id)['payload'])
+        value = shadow['state']['reported']['state']
+    except Exception as e:
+        logger.warning(f'unable to read shadow for {endpoint_id}: {e}')
+        return None
+
+    shadow_cache.put(endpoint_id, value, shadow.get('version', 0))
+    return value
+
+
+def set_device_state(endpoint_id, value, deadline=None, metrics=NULL_METRICS):
     """
     Update the shadow state for a device, and wait for it to change
     """
-    response = aws_iot.update_thing_shadow(
-        thingName=endpoint_id,
-        payload=json.dumps({
-            'state': {
-                'desired': {
-                    'state': value
+    if deadline is None:
+        deadline = time.monotonic() + _CONFIRMATION_TIMEOUT
+
+    with metrics.phase('ShadowUpdateTime'):
+        response = iot_client().update_thing_shadow(
+            thingName=endpoint_id,
+            payload=json.dumps({
+                'state': {
+                    'desired': {
+                        'state': value
+                    }
                 }
-            }
-        })
-    )
+            })
+        )
     if response is None:
         return
 
     # wait for the reported state to change
-    timeout = time.time() + 5
-    while time.time() < timeout:
-        time.sleep(0.25)
-        try:
-            shadow = json.load(aws_iot.get_thing_shadow(thingName=endpoint_id)['payload'])
-            if shadow['state']['reported']['state'] == value:
-                return True
-        except:
-            pass
+    try:
+        version = json.load(response['payload'])['version']
+    except Exception:
+        version = 0
+    confirmed_version = confirmation.wait(endpoint_id, value, version, deadline=deadline, metrics=metrics)
+    metrics.count('TimedOut', 1 if confirmed_version is None else 0)
+    if confirmed_version is None:
+        shadow_cache.invalidate(endpoint_id)
+        return False
+
+    shadow_cache.put(endpoint_id, value, confirmed_version)
+    return True
+
+
+def set_device_states(states, timeout=_CONFIRMATION_TIMEOUT, metrics=NULL_METRICS):
+    """
+    Update several devices together. The updates run concurrently and share
+    one deadline, so the batch takes as long as the slowest device rather than
+    the sum of them all. Returns the set_device_state result for each endpoint.
 
-    return False
+    Nothing in lambda_handler reaches this yet: Alexa sends a group or routine
+    as a separate PowerController directive for each endpoint, each in its own
+    invocation. It is here for a caller which does receive several endpoints
+    at once, and bench.batch_control exercises it.
+    """
+    # Only batches need a pool, so keep concurrent.futures off the cold start path
+    from concurrent.futures import ThreadPoolExecutor
+
+    deadline = time.monotonic() + timeout
+    workers = max(1, min(_MAX_CONCURRENT_UPDATES, len(states)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            endpoint_id: pool.submit(set_device_state, endpoint_id, value, deadline, metrics)
+            for endpoint_id, value in states.items()
+        }
+
+    results = {}
+    for endpoint_id, future in futures.items():
+        try:
+            results[endpoint_id] = future.result()
+        except Exception as e:
+            logger.warning(f'unable to set state for {endpoint_id}: {e}')
+            results[endpoint_id] = None
+    return results
 
 
 _ACTIONS = {
+    'Alexa': report_state,
     'Alexa.Discovery': discover_devices,
     'Alexa.PowerController': control_device
 }
@@ -131,21 +287,48 @@ def is_valid_payload_version(request):
     return payload_version == '3'
 
 
-def lambda_handler(request, context):
+def directive_name(request):
     """
-    Entry point
+    Name a request by namespace and name for metrics
     """
-    logger.debug(f'lambda_handler request {json.dumps(request)}')
-    logger.debug(f'lambda_handler context {context}')
+    try:
+        header = request['directive']['header']
+        return f"{header['namespace']}.{header['name']}"
+    except (KeyError, TypeError):
+        return 'Malformed'
+
 
-    if 'directive' not in request:
-        return error(type='INVALID_DIRECTIVE', message='Missing key: directive, Is the request a valid Alexa Directive?')
+def dispatch(request, metrics):
+    """
+    Validate a request and pass it to the action for its namespace
+    """
+    with metrics.phase('DispatchTime'):
+        if 'directive' not in request:
+            return error(type='INVALID_DIRECTIVE', message='Missing key: directive, Is the request a valid Alexa Directive?')
 
-    if not is_valid_payload_version(request):
-        return error(type='INTERNAL_ERROR', message='This skill only supports Smart Home API version 3')
+        if not is_valid_payload_version(request):
+            return error(type='INTERNAL_ERROR', message='This skill only supports Smart Home API version 3')
 
-    name = request['directive']['header']['name']
-    namespace = request['directive']['header']['namespace']
+        name = request['directive']['header']['name']
+        namespace = request['directive']['header']['namespace']
 
-    return _ACTIONS[namespace](request)
+        if namespace not in _ACTIONS:
+            return error(type='INVALID_DIRECTIVE', message=f'Unsupported directive: {namespace}.{name}')
+
+        action = _ACTIONS[namespace]
+
+    return action(request, metrics)
+
+
+def lambda_handler(request, context):
+    """
+    Entry point
+    """
+    logger.debug('lambda_handler request %s', _LazyJson(request))
+    logger.debug('lambda_handler context %s', context)
 
+    metrics = InvocationMetrics(directive_name(request)) if emit_metrics else NULL_METRICS
+    try:
+        return dispatch(request, metrics)
+    finally:
+        metrics.emit()
@@ -0,0 +1,99 @@
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+
+_NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'WindowController')
+
+
+class InvocationMetrics:
+    """
+    Per-phase timings and counters for one invocation, written to stdout as a
+    single CloudWatch Embedded Metric Format record. Phases may be recorded
+    from several threads, and a phase recorded more than once is reported as
+    a list of values.
+    """
+    def __init__(self, directive, namespace=_NAMESPACE, stream=None):
+        self._start = time.perf_counter()
+        self._namespace = namespace
+        self._stream = stream
+        self._lock = threading.Lock()
+        self._values = {}
+        self._units = {}
+        self._properties = {'Directive': directive}
+
+    def record(self, name, value, unit='Milliseconds'):
+        with self._lock:
+            self._values.setdefault(name, []).append(value)
+            self._units[name] = unit
+
+    def count(self, name, n=1):
+        with self._lock:
+            values = self._values.setdefault(name, [0])
+            values[0] += n
+            self._units[name] = 'Count'
+
+    def set_property(self, name, value):
+        with self._lock:
+            self._properties[name] = value
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, (time.perf_counter() - start) * 1000)
+
+    def get(self):
+        """
+        The EMF record for this invocation so far
+        """
+        self.record('Duration', (time.perf_counter() - self._start) * 1000)
+        with self._lock:
+            record = {
+                '_aws': {
+                    'Timestamp': int(time.time() * 1000),
+                    'CloudWatchMetrics': [{
+                        'Namespace': self._namespace,
+                        'Dimensions': [['Directive']],
+                        'Metrics': [{'Name': name, 'Unit': unit} for name, unit in self._units.items()]
+                    }]
+                }
+            }
+            record.update(self._properties)
+            for name, values in self._values.items():
+                record[name] = values[0] if len(values) == 1 else values
+            return record
+
+    def emit(self):
+        stream = self._stream or sys.stdout
+        stream.write(json.dumps(self.get(), separators=(',', ':')) + '\n')
+        stream.flush()
+
+
+class _NullMetrics:
+    """
+    Stands in when nobody is collecting metrics
+    """
+    def record(self, name, value, unit='Milliseconds'):
+        pass
+
+    def count(self, name, n=1):
+        pass
+
+    def set_property(self, name, value):
+        pass
+
+    @contextmanager
+    def phase(self, name):
+        yield
+
+    def emit(self):
+        pass
+
+
+NULL_METRICS = _NullMetrics()
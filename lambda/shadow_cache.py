@@ -0,0 +1,40 @@
+import threading
+import time
+
+
+class ShadowCache:
+    """
+    Reported device states, kept across warm invocations of the Lambda so that
+    repeated state reports don't each cost a get_thing_shadow round trip.
+    Entries expire after a TTL, because devices can also change state locally,
+    and an entry is only replaced by one with a newer shadow version.
+    """
+    def __init__(self, ttl=30.0, clock=time.monotonic):
+        self._ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def get(self, thing_name):
+        """
+        The cached reported state for a thing, or None if absent or expired
+        """
+        with self._lock:
+            entry = self._entries.get(thing_name)
+            if entry is None:
+                return None
+            state, version, expires = entry
+            if self._clock() >= expires:
+                return None
+            return state
+
+    def put(self, thing_name, state, version):
+        with self._lock:
+            entry = self._entries.get(thing_name)
+            if entry is not None and entry[1] > version:
+                return
+            self._entries[thing_name] = (state, version, self._clock() + self._ttl)
+
+    def invalidate(self, thing_name):
+        with self._lock:
+            self._entries.pop(thing_name, None)
@@ -0,0 +1,112 @@
+import json
+import time
+import unittest
+from unittest import mock
+
+import lambda_function
+from bench.fake_iot import FakeIoTData
+from shadow_cache import ShadowCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def report_state_directive(endpoint_id):
+    return {
+        'directive': {
+            'header': {
+                'namespace': 'Alexa',
+                'name': 'ReportState',
+                'payloadVersion': '3',
+                'messageId': 'message-1',
+                'correlationToken': 'token-1'
+            },
+            'endpoint': {
+                'scope': {'type': 'BearerToken', 'token': 'access-token'},
+                'endpointId': endpoint_id
+            },
+            'payload': {}
+        }
+    }
+
+
+class DeviceStateTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        self.iot = FakeIoTData(delay=None)
+        for name, value in [('_aws_iot', self.iot),
+                            ('shadow_cache', ShadowCache(ttl=30.0, clock=self.clock)),
+                            ('emit_metrics', False)]:
+            patcher = mock.patch.object(lambda_function, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def reported(self, endpoint_id, value):
+        self.iot.update_thing_shadow(thingName=endpoint_id,
+                                     payload=json.dumps({'state': {'reported': {'state': value}}}))
+
+    def test_cache_hit_skips_get_thing_shadow(self):
+        self.reported('garden-lights', 'ON')
+        self.assertEqual(lambda_function.get_device_state('garden-lights'), 'ON')
+        self.assertEqual(lambda_function.get_device_state('garden-lights'), 'ON')
+        self.assertEqual(self.iot.calls['get_thing_shadow'], 1)
+
+    def test_entry_expires_after_ttl(self):
+        self.reported('garden-lights', 'ON')
+        lambda_function.get_device_state('garden-lights')
+        self.reported('garden-lights', 'OFF')
+        self.clock.now = 30.0
+        self.assertEqual(lambda_function.get_device_state('garden-lights'), 'OFF')
+        self.assertEqual(self.iot.calls['get_thing_shadow'], 2)
+
+    def test_older_version_does_not_replace_newer(self):
+        self.reported('garden-lights', 'OFF')
+        stale = json.load(self.iot.get_thing_shadow(thingName='garden-lights')['payload'])
+
+        self.iot = FakeIoTData(delay=0.01)
+        lambda_function._aws_iot = self.iot
+        self.assertIs(lambda_function.set_device_state('garden-lights', 'ON'), True)
+
+        # A read which started before the change finishes after it, and is ignored
+        lambda_function.shadow_cache.put('garden-lights', stale['state']['reported']['state'], stale['version'])
+        self.assertEqual(lambda_function.get_device_state('garden-lights'), 'ON')
+
+    def test_timed_out_set_invalidates(self):
+        self.reported('fresh-air', 'OFF')
+        self.assertEqual(lambda_function.get_device_state('fresh-air'), 'OFF')
+
+        # The device is offline and never confirms
+        result = lambda_function.set_device_state('fresh-air', 'ON', deadline=time.monotonic() + 0.3)
+        self.assertIs(result, False)
+        self.assertIsNone(lambda_function.shadow_cache.get('fresh-air'))
+
+    def test_state_report(self):
+        self.reported('garden-lights', 'ON')
+        response = lambda_function.lambda_handler(report_state_directive('garden-lights'), None)
+
+        header = response['event']['header']
+        self.assertEqual((header['namespace'], header['name'], header['payloadVersion']),
+                         ('Alexa', 'StateReport', '3'))
+        self.assertTrue(header['messageId'])
+        self.assertEqual(response['event']['endpoint']['endpointId'], 'garden-lights')
+        self.assertEqual(response['event']['payload'], {})
+
+        properties = {(p['namespace'], p['name']): p['value'] for p in response['context']['properties']}
+        self.assertEqual(properties[('Alexa.PowerController', 'powerState')], 'ON')
+        self.assertEqual(properties[('Alexa.EndpointHealth', 'connectivity')], {'value': 'OK'})
+        for prop in response['context']['properties']:
+            self.assertIn('timeOfSample', prop)
+
+    def test_state_report_unreachable(self):
+        response = lambda_function.lambda_handler(report_state_directive('summerhouse-lights'), None)
+        self.assertEqual(response['event']['header']['name'], 'ErrorResponse')
+        self.assertEqual(response['event']['payload']['type'], 'ENDPOINT_UNREACHABLE')
+
+
+if __name__ == '__main__':
+    unittest.main()
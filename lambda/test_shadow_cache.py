@@ -0,0 +1,45 @@
+import unittest
+
+from shadow_cache import ShadowCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class ShadowCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        self.cache = ShadowCache(ttl=30.0, clock=self.clock)
+
+    def test_hit(self):
+        self.cache.put('garden-lights', 'ON', 3)
+        self.assertEqual(self.cache.get('garden-lights'), 'ON')
+        self.assertIsNone(self.cache.get('fresh-air'))
+
+    def test_expires_after_ttl(self):
+        self.cache.put('garden-lights', 'ON', 3)
+        self.clock.now = 29.9
+        self.assertEqual(self.cache.get('garden-lights'), 'ON')
+        self.clock.now = 30.0
+        self.assertIsNone(self.cache.get('garden-lights'))
+
+    def test_older_version_does_not_replace_newer(self):
+        self.cache.put('garden-lights', 'ON', 5)
+        self.cache.put('garden-lights', 'OFF', 4)
+        self.assertEqual(self.cache.get('garden-lights'), 'ON')
+        self.cache.put('garden-lights', 'OFF', 6)
+        self.assertEqual(self.cache.get('garden-lights'), 'OFF')
+
+    def test_invalidate(self):
+        self.cache.put('garden-lights', 'ON', 3)
+        self.cache.invalidate('garden-lights')
+        self.assertIsNone(self.cache.get('garden-lights'))
+
+
+if __name__ == '__main__':
+    unittest.main()